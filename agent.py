@@ -1,7 +1,16 @@
-from typing import List
+import operator
+import re
+from typing import Annotated, List, Optional
 from typing_extensions import TypedDict
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END, START
-from research.workflow.graph import run_research_workflow
+from langgraph.types import Send
+from instrumentation import model_name, record_llm, stage
+from rate_limits import llm_slot
+from research.workflow.graph import arun_research_workflow, run_research_workflow
+
+MAX_STAKEHOLDER_GROUPS = 7
 
 
 
@@ -10,8 +19,40 @@ from research.workflow.graph import run_research_workflow
 class MainGraphState(TypedDict):
     """Represents the current state of the analysis process"""
     stakeholders: str
+    group_findings: Annotated[List[str], operator.add]
     resarch_result:str
-    errors: List[str]
+    errors: Annotated[List[str], operator.add]
+
+
+class GroupResearchState(TypedDict):
+    """Input of one per-stakeholder-group research branch"""
+    group: str
+
+
+def get_initial_state() -> MainGraphState:
+    """Create initial analysis state."""
+    return MainGraphState(
+        stakeholders="",
+        group_findings=[],
+        resarch_result="",
+        errors=[]
+    )
+
+
+def split_stakeholder_groups(stakeholders: str) -> List[str]:
+    """Turn the stakeholder research answer (one group per line) into a list of group names"""
+    groups = []
+    for line in stakeholders.splitlines():
+        group = re.sub(r'^\s*(?:[-•*]|\d+[.)])\s*', '', line).strip(' *:')
+        if group and group.lower() not in (g.lower() for g in groups):
+            groups.append(group)
+    return groups[:MAX_STAKEHOLDER_GROUPS]
+
+
+def research_thread(config: Optional[RunnableConfig], name: str) -> Optional[str]:
+    """Checkpoint thread of one research run inside an audit, None when the audit isn't checkpointed"""
+    audit_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    return f"{audit_id}/{name}" if audit_id else None
     
 
 
@@ -21,146 +62,230 @@ class Agent:
         self.llm = llm
 
 
+    def stakeholders_request(self):
+        """Research task and output format for identifying the stakeholder groups"""
+        stakeholders_task = """
+            identify the relevant stakeholder groups for non-profit organizations, 
+                focusing on groups such as Donors, Regulators, Beneficiaries, Partners, Internal Staff, Public/Media, and Volunteers.
 
-    def get_stakeholders(self, state: MainGraphState) -> MainGraphState:
-        """
-        Node function that runs research tasks in parallel using async
-        """
-        try:
-            # Run both research tasks asynchronously
+            1. Think step-by-step to determine who the main stakeholder groups of the organization are, 
+                based on the content and information provided on the website.
+            2. Assess if each identified group is essential to achieving the organization’s mission.
+            3. Note any key stakeholder groups that may be missing or underserved.
+            
+            
+            """
 
+        output_format = "Your answer should only list the stakeholder group names, without any introductions, conclusions, or additional commentary. Just the group names, each on a new line."
 
-            stakeholders_task = """
-                identify the relevant stakeholder groups for non-profit organizations, 
-                    focusing on groups such as Donors, Regulators, Beneficiaries, Partners, Internal Staff, Public/Media, and Volunteers.
+        return stakeholders_task, output_format
 
-                1. Think step-by-step to determine who the main stakeholder groups of the organization are, 
-                    based on the content and information provided on the website.
-                2. Assess if each identified group is essential to achieving the organization’s mission.
-                3. Note any key stakeholder groups that may be missing or underserved.
-                
+
+    def main_research_request(self, stakeholder_groups):
+        """Research task and output format for the stakeholder audit"""
+        resarch_task = f"""
+            As part of our ongoing marketing support, you will conduct an audit of the client's website to understand how the relevant stakeholders perceive the organization. Focus solely on the stakeholders selected for this task.
+
+            Instructions:
+
+            1. Stakeholder Selection:
+            - You will be provided with a list of relevant stakeholders for this audit: {stakeholder_groups}. Ensure that your research focuses exclusively on these stakeholders.
+            - Do not include any stakeholders that are not relevant to the organization’s objectives.
+
+            2. Audit Focus:
+            - Analyze how the organization is perceived by the selected stakeholders based on their website. Key areas to assess include:
+                - Transparency and clarity of information
+                - Ease of navigation and accessibility
+                - Communication of mission and values
+                - Trust-building and credibility factors
+
+            3. **Recommendations for Improvement:**
+            - Provide tailored recommendations on how the organization can improve its online presence to better align with the needs and expectations of the selected stakeholders. Suggestions should include:
+                - How to improve engagement with the selected stakeholders
+                - How to make key information (e.g., mission, impact, funding transparency) more visible and accessible
+                - Recommendations for enhancing user experience and accessibility on the site
+
+            Deliverables:
+            - A detailed report summarizing the findings of the audit, including areas where the organization excels or needs improvement, based only on the relevant stakeholders.
+            - Actionable recommendations for improving the client’s website to enhance alignment with the selected stakeholders.
+
+        """
+
+        output_format = """
+            Please structure your research findings in the following format:
+
+            1. Summary of Findings:
+
+            **[Stakeholder Perceptions]**
+            • Provide 3-4 key findings about how the selected stakeholders perceive the organization through the website:
+                - Communication effectiveness and transparency
+                - Mission and values alignment
+                - Accessibility and engagement features
+                - Trust-building elements
+
+            **[Website Effectiveness]**
+            • Analyze 2-3 key aspects of the website's effectiveness:
+                - Navigation and user experience
+                - Content organization and clarity
+                - Feature accessibility and functionality
+
+            **[Recommendations]**
+            • List 2-3 specific, actionable improvements:
+                - Engagement enhancement suggestions
+                - Accessibility improvements
+                - Content organization recommendations
+
+            **[Quality Assessment]**
+                Evaluate the overall quality of your findings using this scale:
+                    0.0-0.3: Little to no direct evidence
+                    0.4-0.6: Some evidence but with gaps
+                    0.7-0.8: Good evidence with minor gaps
+                    0.9-1.0: Strong, comprehensive evidence
                 
-                """
-            
-            output_format = "Your answer should only list the stakeholder group names, without any introductions, conclusions, or additional commentary. Just the group names, each on a new line."
+                - Confidence Level: [Insert your confidence level here]
+                - Explanation: [Briefly explain why you assigned this confidence level]
+
+
+            2. Additional Notes:
+            • Include 2-3 broader insights about:
+            - Patterns in stakeholder engagement
+            - Opportunities for enhancement
+            - Notable strengths or challenges
+            - Future considerations
+
+            Formatting Requirements:
+            - Use bullet points (•) for all listed items
+            - Keep each point concise and specific
+            - Include examples where relevant
+            - Separate sections with blank lines
+            - Start each main section with a number (1., 2.)
+            - Use **Section Title** format for subsection titles
+            """
 
+        return resarch_task, output_format
 
 
-            stakeholders_result = run_research_workflow(self.retriver, stakeholders_task, output_format, 1)
-            state["stakeholders"] = stakeholders_result
-                    
-        except Exception as e:
-            state["errors"].append(f"Error in parallel research: {str(e)}")
-        
-        return state
+    def group_request(self, group):
+        """Research task and output format for auditing the website from one stakeholder group's perspective"""
+        resarch_task, _ = self.main_research_request(group)
+        output_format = f"""
+            List the findings for the {group} stakeholder group only, as concise bullet points (•) under:
+            **[Perceptions]**, **[Website Effectiveness]**, **[Recommendations]** and **[Confidence]**
+            (a 0.0-1.0 confidence level with a one-line explanation).
+            Do not add introductions or conclusions.
+            """
+        return resarch_task, output_format
+
+
+    def merge_messages(self, state: MainGraphState):
+        groups = split_stakeholder_groups(state["stakeholders"]) or [state["stakeholders"]]
+        resarch_task, output_format = self.main_research_request(", ".join(groups))
+        findings = "\n\n".join(state["group_findings"])
+        system = """You are a research summarization expert. 
+            Your task is to merge the audit findings gathered separately for each stakeholder group into one report and evaluate the level of the findings"""
+        human = f"""Merge the per-stakeholder findings into a single report for this task:
+                Task:
+                {resarch_task}
+
+                Findings by Stakeholder Group:
+                {findings}
 
+                Output Format:
+                {output_format}"""
+        return [SystemMessage(content=system), HumanMessage(content=human)]
 
-    def main_research(self, state: MainGraphState) -> MainGraphState:
-        """create the main research task"""
-        stakeholder_groups = state["stakeholders"]
 
+    def get_stakeholders(self, state: MainGraphState, config: RunnableConfig) -> dict:
+        """Node function that identifies the organization's stakeholder groups"""
         try:
-            resarch_task = f"""
-                As part of our ongoing marketing support, you will conduct an audit of the client's website to understand how the relevant stakeholders perceive the organization. Focus solely on the stakeholders selected for this task.
+            stakeholders_task, output_format = self.stakeholders_request()
+            stakeholders_result = run_research_workflow(self.retriver, stakeholders_task, output_format, 1,
+                                                        research_thread(config, "stakeholders"))
+            return {"stakeholders": stakeholders_result}
+        except Exception as e:
+            return {"errors": [f"Error in stakeholders research: {str(e)}"]}
 
-                Instructions:
 
-                1. Stakeholder Selection:
-                - You will be provided with a list of relevant stakeholders for this audit: {stakeholder_groups}. Ensure that your research focuses exclusively on these stakeholders.
-                - Do not include any stakeholders that are not relevant to the organization’s objectives.
+    async def aget_stakeholders(self, state: MainGraphState, config: RunnableConfig) -> dict:
+        """Node function that identifies the organization's stakeholder groups without blocking the event loop"""
+        try:
+            stakeholders_task, output_format = self.stakeholders_request()
+            return {"stakeholders": await arun_research_workflow(self.retriver, stakeholders_task, output_format, 1,
+                                                                 research_thread(config, "stakeholders"))}
+        except Exception as e:
+            return {"errors": [f"Error in stakeholders research: {str(e)}"]}
 
-                2. Audit Focus:
-                - Analyze how the organization is perceived by the selected stakeholders based on their website. Key areas to assess include:
-                    - Transparency and clarity of information
-                    - Ease of navigation and accessibility
-                    - Communication of mission and values
-                    - Trust-building and credibility factors
 
-                3. **Recommendations for Improvement:**
-                - Provide tailored recommendations on how the organization can improve its online presence to better align with the needs and expectations of the selected stakeholders. Suggestions should include:
-                    - How to improve engagement with the selected stakeholders
-                    - How to make key information (e.g., mission, impact, funding transparency) more visible and accessible
-                    - Recommendations for enhancing user experience and accessibility on the site
+    def fan_out_groups(self, state: MainGraphState) -> List[Send]:
+        """Send every stakeholder group to its own research branch"""
+        groups = split_stakeholder_groups(state["stakeholders"]) or ["all relevant stakeholder groups"]
+        return [Send("group_researcher", GroupResearchState(group=group)) for group in groups]
 
-                Deliverables:
-                - A detailed report summarizing the findings of the audit, including areas where the organization excels or needs improvement, based only on the relevant stakeholders.
-                - Actionable recommendations for improving the client’s website to enhance alignment with the selected stakeholders.
 
-            """
-            
-            output_format = """
-                Please structure your research findings in the following format:
-
-                1. Summary of Findings:
-
-                **[Stakeholder Perceptions]**
-                • Provide 3-4 key findings about how the selected stakeholders perceive the organization through the website:
-                    - Communication effectiveness and transparency
-                    - Mission and values alignment
-                    - Accessibility and engagement features
-                    - Trust-building elements
-
-                **[Website Effectiveness]**
-                • Analyze 2-3 key aspects of the website's effectiveness:
-                    - Navigation and user experience
-                    - Content organization and clarity
-                    - Feature accessibility and functionality
-
-                **[Recommendations]**
-                • List 2-3 specific, actionable improvements:
-                    - Engagement enhancement suggestions
-                    - Accessibility improvements
-                    - Content organization recommendations
-
-                **[Quality Assessment]**
-                    Evaluate the overall quality of your findings using this scale:
-                        0.0-0.3: Little to no direct evidence
-                        0.4-0.6: Some evidence but with gaps
-                        0.7-0.8: Good evidence with minor gaps
-                        0.9-1.0: Strong, comprehensive evidence
-                    
-                    - Confidence Level: [Insert your confidence level here]
-                    - Explanation: [Briefly explain why you assigned this confidence level]
-
-
-                2. Additional Notes:
-                • Include 2-3 broader insights about:
-                - Patterns in stakeholder engagement
-                - Opportunities for enhancement
-                - Notable strengths or challenges
-                - Future considerations
-
-                Formatting Requirements:
-                - Use bullet points (•) for all listed items
-                - Keep each point concise and specific
-                - Include examples where relevant
-                - Separate sections with blank lines
-                - Start each main section with a number (1., 2.)
-                - Use **Section Title** format for subsection titles
-                """
-
-            result = run_research_workflow(self.retriver, resarch_task, output_format, 3)
-            state["resarch_result"] = result
-        
+    def group_research(self, state: GroupResearchState, config: RunnableConfig) -> dict:
+        """Audit the website for a single stakeholder group"""
+        try:
+            resarch_task, output_format = self.group_request(state["group"])
+            result = run_research_workflow(self.retriver, resarch_task, output_format, 3,
+                                           research_thread(config, f"group/{state['group']}"))
+            return {"group_findings": [f"[{state['group']}]\n{result}"]}
+        except Exception as e:
+            return {"errors": [f"Error in {state['group']} research: {str(e)}"]}
+
+
+    async def agroup_research(self, state: GroupResearchState, config: RunnableConfig) -> dict:
+        """Audit the website for a single stakeholder group without blocking the event loop"""
+        try:
+            resarch_task, output_format = self.group_request(state["group"])
+            result = await arun_research_workflow(self.retriver, resarch_task, output_format, 3,
+                                                  research_thread(config, f"group/{state['group']}"))
+            return {"group_findings": [f"[{state['group']}]\n{result}"]}
+        except Exception as e:
+            return {"errors": [f"Error in {state['group']} research: {str(e)}"]}
+
+
+    def merge_findings(self, state: MainGraphState) -> dict:
+        """Merge the per-group findings into the final report"""
+        if not state["group_findings"]:
+            return {"errors": ["No stakeholder group research succeeded"]}
+        try:
+            with stage("merge"):
+                response = self.llm.invoke(self.merge_messages(state))
+                record_llm(model_name(self.llm), response)
+            return {"resarch_result": str(response.content)}
         except Exception as e:
-            state["errors"].append(f"Error in parallel research: {str(e)}")
+            return {"errors": [f"Error merging research: {str(e)}"]}
 
-        return state
+
+    async def amerge_findings(self, state: MainGraphState) -> dict:
+        """Merge the per-group findings into the final report without blocking the event loop"""
+        if not state["group_findings"]:
+            return {"errors": ["No stakeholder group research succeeded"]}
+        try:
+            with stage("merge"):
+                async with llm_slot():
+                    response = await self.llm.ainvoke(self.merge_messages(state))
+                record_llm(model_name(self.llm), response)
+            return {"resarch_result": str(response.content)}
+        except Exception as e:
+            return {"errors": [f"Error merging research: {str(e)}"]}
 
    
-    def create_analysis_graph(self) -> StateGraph:
-        """Create the analysis workflow graph"""
+    def create_analysis_graph(self, use_async: bool = False) -> StateGraph:
+        """Create the analysis workflow graph, with coroutine nodes when use_async is set"""
         
 
         workflow = StateGraph(MainGraphState)
         
         # Add nodes
-        workflow.add_node("stakeholders_researcher", self.get_stakeholders)
-        workflow.add_node("main_researcher", self.main_research)
+        workflow.add_node("stakeholders_researcher", self.aget_stakeholders if use_async else self.get_stakeholders)
+        workflow.add_node("group_researcher", self.agroup_research if use_async else self.group_research)
+        workflow.add_node("merge_findings", self.amerge_findings if use_async else self.merge_findings)
         
-        # Define edges
+        # Define edges: one research branch per stakeholder group, merged once all have finished
         workflow.add_edge(START, "stakeholders_researcher")
-        workflow.add_edge("stakeholders_researcher", "main_researcher")
-        workflow.add_edge("main_researcher", END)
+        workflow.add_conditional_edges("stakeholders_researcher", self.fan_out_groups, ["group_researcher"])
+        workflow.add_edge("group_researcher", "merge_findings")
+        workflow.add_edge("merge_findings", END)
 
         return workflow
\ No newline at end of file
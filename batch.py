@@ -0,0 +1,167 @@
+"""Audit many organizations concurrently from one process.
+
+Usage:
+    python batch.py urls.txt --crawl-concurrency 4 --embedding-concurrency 2 --llm-concurrency 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+
+from agent import Agent, MainGraphState, get_initial_state
+from checkpointer import ainvoke_resumable, get_checkpointer, thread_config
+from helper import create_pdf
+from instrumentation import Trace, stage, use_trace
+from rate_limits import BATCH, chat_model, embedding_model, use_llm_slots, use_priority
+from retrieval import CachedEmbeddings, EmbeddingCache
+from retriver import Retriver
+
+
+load_dotenv()
+
+OUTPUT_DIR = 'output_reports'
+
+
+@dataclass
+class BatchLimits:
+    crawl: int = 4  # sites crawled at the same time
+    embedding: int = 2  # embedding requests in flight across all sites
+    llm: int = 4  # chat requests in flight across all sites
+
+
+@dataclass
+class AuditResult:
+    url: str
+    status: str = "pending"
+    report: Optional[str] = None
+    error: Optional[str] = None
+    pages: int = 0
+    chunks: int = 0
+    trace: Optional[str] = None
+    cost: float = 0.0
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def read_urls(path: str) -> List[str]:
+    """One URL per line; blank lines and lines starting with # are ignored"""
+    with open(path, encoding="utf-8") as f:
+        urls = [line.strip() for line in f]
+    return list(dict.fromkeys(url for url in urls if url and not url.startswith("#")))
+
+
+def report_filename(url: str) -> str:
+    parsed = urlparse(url)
+    slug = re.sub(r'[^a-zA-Z0-9]+', '_', f"{parsed.netloc}{parsed.path}").strip('_')
+    return f"{slug or 'site'}.pdf"
+
+
+class BatchAuditor:
+    def __init__(self, limits: BatchLimits, incremental: bool = True, prometheus: bool = False):
+        self.limits = limits
+        self.incremental = incremental
+        self.prometheus = prometheus
+        self.embeddings = CachedEmbeddings(embedding_model(), EmbeddingCache())
+        self.llm = chat_model("gpt-4o", temperature=0)
+
+    async def research(self, retriver: Retriver, audit_id: str) -> MainGraphState:
+        """Run the analysis graph checkpointed under audit_id, resuming it if an earlier batch was interrupted"""
+        agent = Agent(retriver=retriver, llm=self.llm)
+        app = agent.create_analysis_graph(use_async=True).compile(checkpointer=get_checkpointer())
+        return await ainvoke_resumable(app, get_initial_state(), thread_config(audit_id))
+
+    async def audit(self, url: str) -> AuditResult:
+        """Audit one site; any failure is recorded on the result instead of raised"""
+        result = AuditResult(url=url)
+        trace = Trace(url)
+        # Interactive audits sharing the process get their OpenAI requests scheduled first
+        with use_trace(trace), use_priority(BATCH):
+            await self._audit(url, result)
+        result.timings = trace.wall_times()
+        result.timings["total"] = trace.to_dict()["wall_time"]
+        result.cost = trace.to_dict()["total_cost"]
+        result.trace = os.path.join(OUTPUT_DIR, report_filename(url).replace(".pdf", "_trace.json"))
+        trace.write_json(result.trace)
+        if self.prometheus:
+            trace.write_prometheus(result.trace.replace(".json", ".prom"))
+        return result
+
+    async def _audit(self, url: str, result: AuditResult) -> None:
+        try:
+            retriver = Retriver(url, incremental=self.incremental, embeddings=self.embeddings, build=False)
+            await retriver.abuild(self.crawl_slots, self.embedding_slots)
+            result.pages, result.chunks = len(retriver.urls), len(retriver.docs)
+            if not retriver.docs:
+                raise ValueError("no pages could be loaded")
+
+            # The slot is taken per chat request, so a site's concurrent group branches share the limit too
+            with use_llm_slots(self.llm_slots):
+                final_state = await self.research(retriver, url)
+            if not final_state["resarch_result"]:
+                raise ValueError("; ".join(final_state["errors"]) or "research produced no result")
+
+            filename = report_filename(url)
+            with stage("report"):
+                await asyncio.to_thread(create_pdf, final_state["resarch_result"], filename, retriver.urls)
+            result.report = os.path.join(OUTPUT_DIR, filename)
+            result.error = "; ".join(final_state["errors"]) or None
+            result.status = "ok"
+        except Exception as e:
+            result.status = "failed"
+            result.error = f"{type(e).__name__}: {e}"
+            print(f"Audit of {url} failed: {result.error}")
+
+    async def run(self, urls: List[str]) -> List[AuditResult]:
+        self.crawl_slots = asyncio.Semaphore(self.limits.crawl)
+        self.embedding_slots = asyncio.Semaphore(self.limits.embedding)
+        self.llm_slots = asyncio.Semaphore(self.limits.llm)
+        return await asyncio.gather(*(self.audit(url) for url in urls))
+
+
+def write_manifest(results: List[AuditResult], limits: BatchLimits, elapsed: float, path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    manifest = {
+        "limits": asdict(limits),
+        "elapsed": round(elapsed, 3),
+        "succeeded": sum(1 for r in results if r.status == "ok"),
+        "failed": sum(1 for r in results if r.status != "ok"),
+        "audits": [asdict(r) for r in results],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Manifest saved to {path}")
+
+
+def run_batch(urls_file: str, limits: BatchLimits, incremental: bool = True, prometheus: bool = False,
+              manifest_path: str = os.path.join(OUTPUT_DIR, "batch_manifest.json")) -> List[AuditResult]:
+    urls = read_urls(urls_file)
+    start = time.perf_counter()
+    results = asyncio.run(BatchAuditor(limits, incremental, prometheus).run(urls))
+    write_manifest(results, limits, time.perf_counter() - start, manifest_path)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Audit every URL in a file concurrently")
+    parser.add_argument("urls_file", help="text file with one URL per line")
+    parser.add_argument("--crawl-concurrency", type=int, default=BatchLimits.crawl)
+    parser.add_argument("--embedding-concurrency", type=int, default=BatchLimits.embedding)
+    parser.add_argument("--llm-concurrency", type=int, default=BatchLimits.llm)
+    parser.add_argument("--full", action="store_true", help="ignore pages cached by earlier audits")
+    parser.add_argument("--prometheus", action="store_true", help="also write Prometheus text-format traces")
+    parser.add_argument("--manifest", default=os.path.join(OUTPUT_DIR, "batch_manifest.json"))
+    args = parser.parse_args()
+
+    run_batch(
+        args.urls_file,
+        BatchLimits(crawl=args.crawl_concurrency, embedding=args.embedding_concurrency, llm=args.llm_concurrency),
+        incremental=not args.full,
+        prometheus=args.prometheus,
+        manifest_path=args.manifest,
+    )
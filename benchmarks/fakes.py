@@ -0,0 +1,112 @@
+"""Deterministic stand-ins for the OpenAI chat and embedding models."""
+import asyncio
+import time
+import typing
+from typing import Any, Dict, List, Sequence, Type
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, BaseMessage
+from pydantic import BaseModel
+
+REPORT = (
+    "1. Donors\n"
+    "- Confidence Level: 0.8\n"
+    "2. Volunteers\n"
+    "- Confidence Level: 0.7\n"
+    "3. Partner organizations\n"
+    "- Confidence Level: 0.6\n"
+)
+
+
+def fake_value(annotation: Any, name: str) -> Any:
+    """A valid value for a field of the given type, enough to satisfy the repo's output schemas"""
+    origin = typing.get_origin(annotation)
+    if origin in (list, List):
+        (item,) = typing.get_args(annotation) or (str,)
+        return [fake_value(item, name)]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return fake_instance(annotation)
+    if annotation is float:
+        return 0.9
+    if annotation is int:
+        return 1
+    if annotation is bool:
+        return True
+    return f"{name} about the organization's programs and impact"
+
+
+def fake_instance(schema: Type[BaseModel]) -> BaseModel:
+    return schema(**{name: fake_value(field.annotation, name) for name, field in schema.model_fields.items()})
+
+
+def usage(messages: Sequence[BaseMessage], output: str) -> Dict[str, int]:
+    prompt = sum(len(str(message.content)) for message in messages) // 4
+    completion = len(output) // 4
+    return {"input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion}
+
+
+class FakeChatModel:
+    """Answers every prompt after `latency` seconds; structured calls get a schema-valid instance"""
+
+    model_name = "fake-chat"
+    temperature = 0
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def _message(self, messages: Sequence[BaseMessage], content: str = REPORT) -> AIMessage:
+        self.calls += 1
+        return AIMessage(content=content, usage_metadata=usage(messages, content))
+
+    def invoke(self, messages: Sequence[BaseMessage]) -> AIMessage:
+        time.sleep(self.latency)
+        return self._message(messages)
+
+    async def ainvoke(self, messages: Sequence[BaseMessage]) -> AIMessage:
+        await asyncio.sleep(self.latency)
+        return self._message(messages)
+
+    def with_structured_output(self, schema: Type[BaseModel], include_raw: bool = False) -> "FakeStructuredModel":
+        return FakeStructuredModel(self, schema, include_raw)
+
+
+class FakeStructuredModel:
+    def __init__(self, chat: FakeChatModel, schema: Type[BaseModel], include_raw: bool):
+        self.chat = chat
+        self.schema = schema
+        self.include_raw = include_raw
+
+    def _output(self, messages: Sequence[BaseMessage]) -> Any:
+        parsed = fake_instance(self.schema)
+        if not self.include_raw:
+            return parsed
+        raw = self.chat._message(messages, parsed.model_dump_json())
+        return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+    def invoke(self, messages: Sequence[BaseMessage]) -> Any:
+        time.sleep(self.chat.latency)
+        return self._output(messages)
+
+    async def ainvoke(self, messages: Sequence[BaseMessage]) -> Any:
+        await asyncio.sleep(self.chat.latency)
+        return self._output(messages)
+
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    """Hash-seeded vectors, so equal texts embed equally, with optional per-request latency"""
+
+    model: str = "fake-embedding"
+    latency: float = 0.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return super().embed_query(text)
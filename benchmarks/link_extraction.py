@@ -0,0 +1,72 @@
+"""Compare the crawler's link extraction against the previous BeautifulSoup path.
+
+Run from the repository root: python -m benchmarks.link_extraction
+"""
+import asyncio
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+from bs4 import BeautifulSoup
+
+from crawler.links import extract_links
+
+
+def synthetic_page(links: int = 400, paragraphs: int = 600) -> str:
+    body = "".join(
+        f'<div class="row"><p>Paragraph {i} about our programs, impact and volunteers.</p>'
+        f'<a href="/section/{i % links}" class="nav">Link {i}</a></div>'
+        for i in range(paragraphs)
+    )
+    return f"<html><head><title>Synthetic</title></head><body>{body}</body></html>"
+
+
+def soup_links(html: str):
+    soup = BeautifulSoup(html, 'html.parser')
+    return [link.get('href') for link in soup.find_all('a') if link.get('href')]
+
+
+async def max_loop_lag(parse, html: str, pages: int, executor=None) -> float:
+    """Largest delay seen by a 1ms ticker while `pages` pages are parsed"""
+    loop = asyncio.get_running_loop()
+    lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - start - 0.001)
+
+    tick = asyncio.create_task(ticker())
+    for _ in range(pages):
+        if executor is None:
+            parse(html)
+            await asyncio.sleep(0)
+        else:
+            await loop.run_in_executor(executor, parse, html)
+    done = True
+    await tick
+    return lag
+
+
+def main():
+    html = synthetic_page()
+    assert extract_links(html) == soup_links(html)
+    runs = 20
+    soup_time = timeit.timeit(lambda: soup_links(html), number=runs) / runs
+    stream_time = timeit.timeit(lambda: extract_links(html), number=runs) / runs
+    print(f"page size: {len(html) / 1024:.0f} KiB")
+    print(f"BeautifulSoup:  {soup_time * 1000:.1f} ms/page")
+    print(f"LinkExtractor:  {stream_time * 1000:.1f} ms/page ({soup_time / stream_time:.1f}x faster)")
+
+    inline_lag = asyncio.run(max_loop_lag(soup_links, html, 10))
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        offloop_lag = asyncio.run(max_loop_lag(extract_links, html, 10, executor))
+    print(f"max event-loop stall, BeautifulSoup on loop: {inline_lag * 1000:.1f} ms")
+    print(f"max event-loop stall, LinkExtractor in pool: {offloop_lag * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
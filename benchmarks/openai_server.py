@@ -0,0 +1,131 @@
+"""OpenAI-compatible chat and embedding endpoints served from a local aiohttp server.
+
+Requests and tokens are limited per model and period like an OpenAI account's RPM and TPM
+limits, and requests over either limit get a 429, so clients can be tested against rate limiting.
+"""
+import asyncio
+import base64
+import collections
+import time
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import numpy as np
+from aiohttp import web
+
+from benchmarks.fakes import REPORT
+
+
+@dataclass
+class FakeOpenAIConfig:
+    requests_per_period: int = 20
+    tokens_per_period: int = 20_000
+    period: float = 1.0  # seconds; OpenAI's limits are per minute
+    latency: float = 0.02  # seconds per response
+    dim: int = 64  # embedding size
+
+
+@dataclass
+class ServerStats:
+    requests: int = 0
+    rate_limited: int = 0
+    tokens: int = 0
+    # model -> (time, tokens) of its requests in the last period
+    windows: Dict[str, Deque[Tuple[float, int]]] = field(
+        default_factory=lambda: collections.defaultdict(collections.deque))
+
+
+def _tokens(value: Any) -> int:
+    """Rough token count of a request field, four characters per token like OpenAI's own estimate"""
+    if isinstance(value, str):
+        return max(1, len(value) // 4)
+    if isinstance(value, list):
+        if value and all(isinstance(item, int) for item in value):
+            return len(value)
+        return sum(_tokens(item) for item in value)
+    if isinstance(value, dict):
+        return _tokens(value.get("content") or value.get("text") or "")
+    return 0
+
+
+class FakeOpenAIServer:
+    """Serves /v1/chat/completions and /v1/embeddings on 127.0.0.1 for the duration of an `async with` block"""
+
+    def __init__(self, config: Optional[FakeOpenAIConfig] = None):
+        self.config = config or FakeOpenAIConfig()
+        self.stats = ServerStats()
+        self.runner: Optional[web.AppRunner] = None
+        self.url = ""  # base_url for OpenAI clients, ending in /v1
+
+    def _admit(self, model: str, tokens: int) -> bool:
+        now = time.monotonic()
+        window = self.stats.windows[model]
+        while window and window[0][0] <= now - self.config.period:
+            window.popleft()
+        if (len(window) >= self.config.requests_per_period
+                or sum(t for _, t in window) + tokens > self.config.tokens_per_period):
+            self.stats.rate_limited += 1
+            return False
+        window.append((now, tokens))
+        self.stats.requests += 1
+        self.stats.tokens += tokens
+        return True
+
+    def _headers(self) -> Dict[str, str]:
+        # OpenAI reports the account's per-minute limits on every response
+        return {"x-ratelimit-limit-requests": str(self.config.requests_per_period),
+                "x-ratelimit-limit-tokens": str(self.config.tokens_per_period)}
+
+    def _rate_limited(self) -> web.Response:
+        return web.json_response({"error": {"message": "Rate limit reached", "type": "requests",
+                                            "code": "rate_limit_exceeded"}}, status=429, headers=self._headers())
+
+    async def chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        prompt = sum(_tokens(message) for message in body.get("messages", []))
+        reserved = body.get("max_completion_tokens") or body.get("max_tokens") or 0
+        if not self._admit(body.get("model", ""), prompt + reserved):
+            return self._rate_limited()
+        await asyncio.sleep(self.config.latency)
+        completion = _tokens(REPORT)
+        return web.json_response({
+            "id": f"chatcmpl-{self.stats.requests}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": REPORT}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion},
+        }, headers=self._headers())
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        tokens = _tokens(inputs)
+        if not self._admit(body.get("model", ""), tokens):
+            return self._rate_limited()
+        await asyncio.sleep(self.config.latency)
+        data = []
+        for i, text in enumerate(inputs):
+            vector = np.random.default_rng(abs(hash(str(text))) % 2**32).random(self.config.dim, dtype=np.float32)
+            # The openai client asks for base64 unless told otherwise
+            embedding = (base64.b64encode(vector.tobytes()).decode() if body.get("encoding_format") == "base64"
+                         else vector.tolist())
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        return web.json_response({"object": "list", "data": data, "model": body.get("model", ""),
+                                  "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}, headers=self._headers())
+
+    async def __aenter__(self) -> "FakeOpenAIServer":
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self.chat)
+        app.router.add_post("/v1/embeddings", self.embeddings)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        tcp_site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await tcp_site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}/v1"
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
@@ -0,0 +1,236 @@
+"""Offline end-to-end benchmark of the audit pipeline.
+
+Crawls a synthetic site served from localhost, with fake chat and embedding models, and
+times every stage. Results are compared with benchmarks/baseline.json; a run is reported
+as a regression when a rate drops, or a latency rises, by more than the tolerance.
+
+A second run ingests a larger site with small queues and slow embeddings, and is reported as a
+regression when the crawl finishes far ahead of ingest, i.e. when the queues stop applying backpressure.
+A third runs the same checkpointed audit twice, and is reported as a regression when the second
+run's findings differ in number from the first's.
+
+Run from the repository root:
+    python -m benchmarks.pipeline                   # compare with the baseline
+    python -m benchmarks.pipeline --save-baseline   # record a new baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import asdict
+from typing import Dict, List, Tuple
+
+from agent import Agent, get_initial_state
+from checkpointer import SQLiteCheckpointer, ainvoke_resumable, thread_config
+from benchmarks.fakes import REPORT, FakeChatModel, FakeEmbeddings
+from benchmarks.site import SiteConfig, SiteServer, SyntheticSite
+from crawler import CrawlerConfig, PageStore, URLCrawler
+from helper import _page_document, _splited_docs, aload_urls, create_pdf
+from instrumentation import Trace, use_trace
+from research.analyzer import Research
+from research.llm_cache import LLMCache
+from research.workflow.graph import ResearchEngine, set_research_engine
+from research.workflow.state import get_initial_state as research_state
+from retrieval import IngestConfig, IngestPipeline, VectorIndex
+from retriver import Retriver
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+PDF_NAME = "benchmark.pdf"
+# The crawl may end this far ahead of ingest, as a fraction of the ingest time, before backpressure counts as broken
+BACKPRESSURE_LEAD = 0.25
+
+# metric -> True when higher is better
+METRICS: Dict[str, bool] = {
+    "crawl_pages_per_sec": True,
+    "load_pages_per_sec": True,
+    "split_chunks_per_sec": True,
+    "index_chunks_per_sec": True,
+    "search_context_ms": False,
+    "keyword_search_us": False,
+    "create_pdf_ms": False,
+    "ingest_seconds": False,
+    "end_to_end_seconds": False,
+}
+
+
+def crawler_config(site: SiteConfig) -> CrawlerConfig:
+    return CrawlerConfig(max_urls=site.pages, max_depth=site.pages, rate_limit=0, max_concurrent=10,
+                         schemes=("http", "https"))
+
+
+async def run_stages(site: SiteConfig, llm_latency: float, searches: int) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    async with SiteServer(SyntheticSite(site)) as server:
+        start = time.perf_counter()
+        urls = await URLCrawler(crawler_config(site)).crawl(server.url)
+        results["crawl_pages_per_sec"] = len(urls) / (time.perf_counter() - start)
+
+        store = PageStore()
+        start = time.perf_counter()
+        docs = await aload_urls(urls, store)
+        results["load_pages_per_sec"] = len(urls) / (time.perf_counter() - start)
+
+        pages = [_page_document(store.get(url)) for url in urls if store.get(url) is not None]
+        start = time.perf_counter()
+        chunks = _splited_docs(pages)
+        results["split_chunks_per_sec"] = len(chunks) / (time.perf_counter() - start)
+
+        retriver = Retriver(server.url, embeddings=FakeEmbeddings(size=256), build=False)
+        retriver.urls, retriver.docs = urls, docs
+        start = time.perf_counter()
+        await retriver.aindex()
+        results["index_chunks_per_sec"] = len(docs) / (time.perf_counter() - start)
+
+        llm = FakeChatModel(llm_latency)
+        research = Research(retriver, cache=LLMCache(":memory:"), llm=llm)
+        state = research_state("Who are the stakeholders?", "list", 1)
+        state["search_queries"] = ["Who donates?", "Which programs run?", "Who volunteers?"]
+        start = time.perf_counter()
+        for _ in range(searches):
+            await research.asearch_context(state, ResearchEngine.run_config(retriver))
+        results["search_context_ms"] = (time.perf_counter() - start) / searches * 1000
+
+        start = time.perf_counter()
+        for _ in range(searches):
+            retriver.keywords.top_k(state["search_queries"], retriver.k * 2)
+        results["keyword_search_us"] = (time.perf_counter() - start) / searches / len(state["search_queries"]) * 1e6
+
+        start = time.perf_counter()
+        create_pdf(REPORT, PDF_NAME, urls)
+        results["create_pdf_ms"] = (time.perf_counter() - start) * 1000
+
+        set_research_engine(ResearchEngine(llm=llm, cache=LLMCache(":memory:")))
+        trace = Trace(server.url)
+        start = time.perf_counter()
+        try:
+            with use_trace(trace):
+                retriver = await Retriver.acreate(server.url, embeddings=FakeEmbeddings(size=256),
+                                                  crawler_config=crawler_config(site))
+                results["ingest_seconds"] = time.perf_counter() - start
+                app = Agent(retriver, llm).create_analysis_graph(use_async=True).compile()
+                final_state = await app.ainvoke(get_initial_state())
+                create_pdf(final_state["resarch_result"], PDF_NAME, retriver.urls)
+        finally:
+            set_research_engine(None)
+        results["end_to_end_seconds"] = time.perf_counter() - start
+        for stage_name, seconds in trace.wall_times().items():
+            results[f"end_to_end.{stage_name}"] = seconds
+
+    os.remove(os.path.join("output_reports", PDF_NAME))
+    return {name: round(value, 3) for name, value in results.items()}
+
+
+async def run_backpressure(pages: int, embed_latency: float) -> Dict[str, float]:
+    """Ingest with small queues and slow embeddings; the crawl should be held back to the pace of embedding"""
+    site = SiteConfig(pages=pages, page_kb=1)
+    config = IngestConfig(page_queue=4, chunk_queue=16, embed_batch=8)
+    async with SiteServer(SyntheticSite(site)) as server:
+        trace = Trace(server.url)
+        start = time.perf_counter()
+        with use_trace(trace):
+            pipeline = IngestPipeline(PageStore(), FakeEmbeddings(size=64, latency=embed_latency), VectorIndex(),
+                                      config, crawler_config(site))
+            await pipeline.run(server.url)
+        ingest = time.perf_counter() - start
+    return {"backpressure.crawl_seconds": round(trace.wall_times()["crawl"], 3),
+            "backpressure.ingest_seconds": round(ingest, 3)}
+
+
+async def run_repeat_audit(site: SiteConfig) -> Dict[str, int]:
+    """Run one audit id to completion twice; the second run must start afresh, not add to the first"""
+    checkpointer = SQLiteCheckpointer(":memory:")
+    llm = FakeChatModel()
+    set_research_engine(ResearchEngine(llm=llm, cache=LLMCache(":memory:"), checkpointer=checkpointer))
+    results: Dict[str, int] = {}
+    try:
+        async with SiteServer(SyntheticSite(site)) as server:
+            retriver = await Retriver.acreate(server.url, embeddings=FakeEmbeddings(size=64),
+                                              crawler_config=crawler_config(site))
+            app = Agent(retriver, llm).create_analysis_graph(use_async=True).compile(checkpointer=checkpointer)
+            for run in ("first", "second"):
+                final_state = await ainvoke_resumable(app, get_initial_state(), thread_config(server.url))
+                results[f"repeat_audit.{run}_findings"] = len(final_state["group_findings"])
+    finally:
+        set_research_engine(None)
+        checkpointer.close()
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[Tuple[str, float, float]]:
+    """Metrics that regressed by more than `tolerance` (a fraction) against the baseline"""
+    regressions = []
+    for name, higher_is_better in METRICS.items():
+        if name not in baseline or name not in results:
+            continue
+        expected, actual = baseline[name], results[name]
+        if (actual < expected * (1 - tolerance)) if higher_is_better else (actual > expected * (1 + tolerance)):
+            regressions.append((name, expected, actual))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=SiteConfig.pages)
+    parser.add_argument("--fanout", type=int, default=SiteConfig.fanout)
+    parser.add_argument("--page-kb", type=int, default=SiteConfig.page_kb)
+    parser.add_argument("--latency", type=float, default=SiteConfig.latency, help="seconds added to every HTTP response")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake chat model call")
+    parser.add_argument("--searches", type=int, default=20, help="search_context calls to average over")
+    parser.add_argument("--backpressure-pages", type=int, default=150, help="pages of the backpressure run; 0 skips it")
+    parser.add_argument("--backpressure-latency", type=float, default=0.3, help="seconds per fake embedding request")
+    parser.add_argument("--skip-repeat-audit", action="store_true", help="skip running one audit id twice")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression, as a fraction")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    site = SiteConfig(pages=args.pages, fanout=args.fanout, page_kb=args.page_kb, latency=args.latency)
+    params = {**asdict(site), "llm_latency": args.llm_latency, "searches": args.searches}
+    results = asyncio.run(run_stages(site, args.llm_latency, args.searches))
+    for name, value in results.items():
+        print(f"{name:40} {value}")
+
+    checks_failed = False
+    if args.backpressure_pages:
+        backpressure = asyncio.run(run_backpressure(args.backpressure_pages, args.backpressure_latency))
+        for name, value in backpressure.items():
+            print(f"{name:40} {value}")
+        crawl, ingest = backpressure["backpressure.crawl_seconds"], backpressure["backpressure.ingest_seconds"]
+        if crawl < ingest * (1 - BACKPRESSURE_LEAD):
+            print(f"REGRESSION backpressure: crawl finished {ingest - crawl:.2f}s before ingest ({ingest:.2f}s)")
+            checks_failed = True
+    if not args.skip_repeat_audit:
+        repeat = asyncio.run(run_repeat_audit(site))
+        for name, value in repeat.items():
+            print(f"{name:40} {value}")
+        if repeat["repeat_audit.second_findings"] != repeat["repeat_audit.first_findings"]:
+            print("REGRESSION repeat audit: the second run of an audit id kept the first run's findings")
+            checks_failed = True
+
+    if args.save_baseline:
+        if checks_failed:
+            return 1
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"params": params, "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to record one")
+        return 1 if checks_failed else 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["params"] != params:
+        print(f"Warning: baseline was recorded with different parameters: {baseline['params']}")
+    regressions = compare(results, baseline["results"], args.tolerance)
+    for name, expected, actual in regressions:
+        print(f"REGRESSION {name}: {actual} vs baseline {expected}")
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} of the baseline")
+    return 1 if regressions or checks_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Compare OpenAI clients with and without the shared rate-limit scheduler under a burst of requests.
+
+A fake OpenAI-compatible server enforces RPM and TPM limits over a short period. Batch and
+interactive chat requests, plus embedding requests, are sent concurrently. The scheduled clients
+should see few or no 429s and serve interactive requests first. The plain clients rely on the
+openai package's own retries.
+
+Run from the repository root: python -m benchmarks.rate_limits
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from benchmarks.openai_server import FakeOpenAIConfig, FakeOpenAIServer
+from rate_limits import (BATCH, INTERACTIVE, RateLimitScheduler, chat_model, embedding_model,
+                         set_rate_limit_scheduler, use_priority)
+
+PROMPT = "Summarize the organization's programs and who they serve. " * 20
+
+
+async def run_workload(chat, embeddings, requests: int, interactive_every: int) -> Dict[str, float]:
+    latencies: Dict[int, List[float]] = {INTERACTIVE: [], BATCH: []}
+    failed = 0
+
+    async def ask(priority: int) -> None:
+        nonlocal failed
+        start = time.perf_counter()
+        with use_priority(priority):
+            try:
+                await chat.ainvoke(PROMPT)
+            except Exception:
+                failed += 1
+                return
+        latencies[priority].append(time.perf_counter() - start)
+
+    async def embed() -> None:
+        nonlocal failed
+        try:
+            await embeddings.aembed_documents([PROMPT] * 4)
+        except Exception:
+            failed += 1
+
+    start = time.perf_counter()
+    tasks = [ask(INTERACTIVE if i % interactive_every == 0 else BATCH) for i in range(requests)]
+    tasks += [embed() for _ in range(requests // 4)]
+    await asyncio.gather(*tasks)
+    return {
+        "seconds": time.perf_counter() - start,
+        "failed": failed,
+        "interactive_latency": statistics.mean(latencies[INTERACTIVE] or [0.0]),
+        "batch_latency": statistics.mean(latencies[BATCH] or [0.0]),
+    }
+
+
+async def compare(config: FakeOpenAIConfig, requests: int, interactive_every: int) -> None:
+    for name in ("unscheduled", "scheduled"):
+        async with FakeOpenAIServer(config) as server:
+            client_args = {"base_url": server.url, "api_key": "fake"}
+            if name == "scheduled":
+                limits = (config.requests_per_period, config.tokens_per_period)
+                scheduler = RateLimitScheduler(limits={"gpt-4o": limits, "text-embedding": limits},
+                                               period=config.period, base_delay=config.period / 4)
+                set_rate_limit_scheduler(scheduler)
+                chat = chat_model("gpt-4o", max_tokens=100, **client_args)
+                embeddings = embedding_model(check_embedding_ctx_length=False, **client_args)
+            else:
+                chat = ChatOpenAI(model="gpt-4o", temperature=0, max_tokens=100, **client_args)
+                embeddings = OpenAIEmbeddings(check_embedding_ctx_length=False, **client_args)
+            try:
+                results = await run_workload(chat, embeddings, requests, interactive_every)
+            finally:
+                set_rate_limit_scheduler(None)
+            print(f"{name:12} {results['seconds']:6.2f}s  served {server.stats.requests:4}  "
+                  f"429s {server.stats.rate_limited:4}  failed {results['failed']:3}  "
+                  f"interactive {results['interactive_latency']:.2f}s  batch {results['batch_latency']:.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=60, help="chat requests; a quarter as many embedding requests")
+    parser.add_argument("--interactive-every", type=int, default=5, help="one chat request in this many is interactive")
+    parser.add_argument("--rpm", type=int, default=FakeOpenAIConfig.requests_per_period, help="requests per period")
+    parser.add_argument("--tpm", type=int, default=FakeOpenAIConfig.tokens_per_period, help="tokens per period")
+    parser.add_argument("--period", type=float, default=FakeOpenAIConfig.period, help="seconds the limits apply over")
+    args = parser.parse_args()
+    config = FakeOpenAIConfig(requests_per_period=args.rpm, tokens_per_period=args.tpm, period=args.period)
+    asyncio.run(compare(config, args.requests, args.interactive_every))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Synthetic nonprofit website served from a local aiohttp server.
+
+Pages are generated deterministically from a seed, so every run crawls the same site.
+"""
+import asyncio
+import random
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from aiohttp import web
+
+WORDS = (
+    "mission community volunteers donors programs impact education health families youth "
+    "partners grants outreach support annual report board transparency events campaign "
+    "scholarship shelter food clinic training mentors local global sustainable future"
+).split()
+
+SECTIONS = ["about", "programs", "donate", "volunteer", "news", "events", "impact", "team"]
+
+
+@dataclass
+class SiteConfig:
+    pages: int = 50
+    fanout: int = 8  # links from each page to other content pages
+    page_kb: int = 20  # approximate size of each page body
+    latency: float = 0.0  # seconds added to every response
+    sitemap: bool = True  # list every page in /sitemap.xml
+    seed: int = 0
+
+
+class SyntheticSite:
+    def __init__(self, config: SiteConfig):
+        self.config = config
+        self.pages: Dict[str, str] = {}
+        rng = random.Random(config.seed)
+        paths = [self.path(i) for i in range(config.pages)]
+        for i, path in enumerate(paths):
+            links = [paths[(i + 1) % len(paths)]] + rng.sample(paths, min(config.fanout, len(paths)))
+            self.pages[path] = self.render(i, links, rng)
+
+    def path(self, i: int) -> str:
+        return "/" if i == 0 else f"/{SECTIONS[i % len(SECTIONS)]}/page-{i}"
+
+    def render(self, i: int, links, rng: random.Random) -> str:
+        nav = "".join(f'<li><a href="/{section}">{section.title()}</a></li>' for section in SECTIONS)
+        paragraphs = []
+        size = 0
+        while size < self.config.page_kb * 1024:
+            text = " ".join(rng.choice(WORDS) for _ in range(60)).capitalize() + "."
+            paragraphs.append(f"<p>{text}</p>")
+            size += len(text) + 7
+        related = "".join(f'<li><a href="{link}">Related story</a></li>' for link in links)
+        return (
+            f"<html><head><title>Hope Foundation page {i}</title></head><body>"
+            f"<header><nav><ul>{nav}</ul></nav></header>"
+            f"<main><h1>Page {i}</h1>{''.join(paragraphs)}<ul>{related}</ul></main>"
+            f"<footer><p>Hope Foundation is a registered charity. Contact us at info@example.org.</p></footer>"
+            f"</body></html>"
+        )
+
+    def sitemap(self, base_url: str) -> str:
+        urls = "".join(f"<url><loc>{base_url}{path}</loc></url>" for path in self.pages)
+        return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+
+    def robots(self, base_url: str) -> str:
+        sitemap = f"Sitemap: {base_url}/sitemap.xml\n" if self.config.sitemap else ""
+        return f"User-agent: *\nAllow: /\n{sitemap}"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+        base_url = f"{request.scheme}://{request.host}"
+        path = request.path.rstrip("/") or "/"
+        if path == "/robots.txt":
+            return web.Response(text=self.robots(base_url))
+        if path == "/sitemap.xml" and self.config.sitemap:
+            return web.Response(text=self.sitemap(base_url), content_type="application/xml")
+        if path in self.pages:
+            return web.Response(text=self.pages[path], content_type="text/html")
+        return web.Response(status=404, text="not found")
+
+
+class SiteServer:
+    """Serves a SyntheticSite on 127.0.0.1 for the duration of an `async with` block"""
+
+    def __init__(self, site: SyntheticSite):
+        self.site = site
+        self.runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def __aenter__(self) -> "SiteServer":
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self.site.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        tcp_site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await tcp_site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
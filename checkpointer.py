@@ -0,0 +1,216 @@
+"""Durable LangGraph checkpoints in a local SQLite file, so interrupted audits can resume.
+
+Every graph run is a thread keyed by the audit id. `invoke_resumable` / `ainvoke_resumable`
+continue a thread whose last run did not finish from its last completed node. A thread that
+finished is deleted, with the research threads nested under it, before a fresh run starts on it,
+so reducers such as `operator.add` don't carry the last run's values into the new one.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.serde.types import TASKS
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(".cache", "checkpoints.sqlite")
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver[int]):
+    """LangGraph checkpoint saver backed by one SQLite file shared by every graph and thread"""
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH):
+        super().__init__()
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, "
+            "parent_id TEXT, checkpoint_type TEXT NOT NULL, checkpoint BLOB NOT NULL, "
+            "metadata_type TEXT NOT NULL, metadata BLOB NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS writes ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, "
+            "task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL, "
+            "value_type TEXT NOT NULL, value BLOB NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))"
+        )
+        self._conn.commit()
+
+    def _writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str):
+        with closing(self._conn.execute(
+            "SELECT task_id, channel, value_type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )) as cursor:
+            return [(task_id, channel, self.serde.loads_typed((value_type, value)))
+                    for task_id, channel, value_type, value in cursor.fetchall()]
+
+    def _tuple(self, row: tuple) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata = row
+        sends = []
+        if parent_id:
+            sends = [value for _, channel, value in self._writes(thread_id, checkpoint_ns, parent_id)
+                     if channel == TASKS]
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint={**self.serde.loads_typed((checkpoint_type, checkpoint)), "pending_sends": sends},
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                            "checkpoint_id": parent_id}} if parent_id else None,
+            pending_writes=self._writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        configurable = config["configurable"]
+        query = "SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        params: Tuple[Any, ...] = (configurable["thread_id"], configurable.get("checkpoint_ns", ""))
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params += (checkpoint_id,)
+        else:
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._lock:
+            row = self._conn.execute(query, params).fetchone()
+            return self._tuple(row) if row is not None else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        query = "SELECT * FROM checkpoints WHERE 1 = 1"
+        params: Tuple[Any, ...] = ()
+        if config:
+            configurable = config["configurable"]
+            query += " AND thread_id = ?"
+            params += (configurable["thread_id"],)
+            if configurable.get("checkpoint_ns") is not None:
+                query += " AND checkpoint_ns = ?"
+                params += (configurable["checkpoint_ns"],)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params += (checkpoint_id,)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params += (before_id,)
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            tuples = [self._tuple(row) for row in rows]
+        for checkpoint_tuple in tuples:
+            if filter and any(checkpoint_tuple.metadata.get(key) != value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                if limit <= 0:
+                    break
+                limit -= 1
+            yield checkpoint_tuple
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id, checkpoint_ns = configurable["thread_id"], configurable.get("checkpoint_ns", "")
+        saved = {key: value for key, value in checkpoint.items() if key != "pending_sends"}
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], configurable.get("checkpoint_id"),
+                 *self.serde.dumps_typed(saved), *self.serde.dumps_typed(metadata)),
+            )
+            self._conn.commit()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        configurable = config["configurable"]
+        rows = [
+            (configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"],
+             task_id, WRITES_IDX_MAP.get(channel, idx), channel, *self.serde.dumps_typed(value))
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete the thread's checkpoints and those of the threads nested under it ("<thread_id>/...")"""
+        prefix = f"{thread_id}/"
+        with self._lock:
+            for table in ("checkpoints", "writes"):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ? OR substr(thread_id, 1, ?) = ?",
+                    (thread_id, len(prefix), prefix),
+                )
+            self._conn.commit()
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        for checkpoint_tuple in await asyncio.to_thread(
+                lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+_default_checkpointer: Optional[SQLiteCheckpointer] = None
+
+def get_checkpointer() -> SQLiteCheckpointer:
+    """Process-wide checkpointer writing to .cache/checkpoints.sqlite"""
+    global _default_checkpointer
+    if _default_checkpointer is None:
+        _default_checkpointer = SQLiteCheckpointer()
+    return _default_checkpointer
+
+
+def thread_config(thread_id: str, **configurable: Any) -> RunnableConfig:
+    return {"configurable": {"thread_id": thread_id, **configurable}}
+
+
+def invoke_resumable(graph, state: Any, config: RunnableConfig) -> Dict[str, Any]:
+    """Resume the thread's unfinished run from its last completed node, or start a new run with `state`,
+    first deleting the thread if its last run finished"""
+    snapshot = graph.get_state(config)
+    if snapshot.next:
+        print(f"Resuming {config['configurable']['thread_id']} at {', '.join(dict.fromkeys(snapshot.next))}")
+        return graph.invoke(None, config)
+    if snapshot.values:
+        graph.checkpointer.delete_thread(config["configurable"]["thread_id"])
+    return graph.invoke(state, config)
+
+
+async def ainvoke_resumable(graph, state: Any, config: RunnableConfig) -> Dict[str, Any]:
+    """Async counterpart of invoke_resumable"""
+    snapshot = await graph.aget_state(config)
+    if snapshot.next:
+        print(f"Resuming {config['configurable']['thread_id']} at {', '.join(dict.fromkeys(snapshot.next))}")
+        return await graph.ainvoke(None, config)
+    if snapshot.values:
+        await asyncio.to_thread(graph.checkpointer.delete_thread, config["configurable"]["thread_id"])
+    return await graph.ainvoke(state, config)
@@ -1,9 +1,14 @@
-from .models import CrawlerConfig
+from .models import CrawlerConfig, LoaderConfig, Page
 from .crawler import URLCrawler
+from .page_store import PageStore, site_store_path
+from .loader import LoadResult, PageLoader
 import asyncio
-from typing import List
+from typing import List, Optional
 
-def fetch_urls(url: str) -> List[str]:
-    config = CrawlerConfig()
-    crawler = URLCrawler(config)
-    return asyncio.run(crawler.crawl(url))
+def fetch_urls(url: str, store: Optional[PageStore] = None) -> List[str]:
+    return asyncio.run(afetch_urls(url, store))
+
+async def afetch_urls(url: str, store: Optional[PageStore] = None,
+                      config: Optional[CrawlerConfig] = None) -> List[str]:
+    crawler = URLCrawler(config or CrawlerConfig(), store)
+    return await crawler.crawl(url)
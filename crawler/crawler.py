@@ -1,85 +1,194 @@
 import asyncio
 import aiohttp
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urljoin
-from typing import List, Set
-import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from aiohttp import ClientTimeout
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from functools import lru_cache
 
+from instrumentation import count
+from .frontier import Frontier
+from .links import parse_page
 from .models import CrawlerConfig
+from .page_store import PageStore
+from .rate_limiter import HostRateLimiter
+from .robots import RobotsRules, fetch_robots
+from .simhash import SimHashIndex
+from .sitemap import iter_sitemap
 from .utils import normalize_url, is_valid_url, is_same_domain
 
 class URLCrawler:
-    def __init__(self, config: CrawlerConfig):
+    def __init__(self, config: CrawlerConfig, store: Optional[PageStore] = None):
         self.config = config
-        self.visited: Set[str] = set()
-        self.filtered_links: Set[str] = set()
-        self.last_request_time: float = 0
-        self.semaphore = asyncio.Semaphore(config.max_concurrent)
+        self.store = store if store is not None else PageStore()
+        self.frontier = Frontier(config.score_url)
+        self.rate_limiter = HostRateLimiter(config.rate_limit, config.burst)
+        self.accepted: List[str] = []
+        self.executor: Optional[Executor] = None
+        self.robots = RobotsRules()
+        self.lastmod: Dict[str, datetime] = {}
+        self.slots = asyncio.Condition()
+        self.in_flight = 0
+        self.fingerprints = SimHashIndex(config.near_duplicate_bits)
+        self.duplicates: Dict[str, str] = {}  # near-duplicate URL -> accepted URL with the same content
+        self.pages: Optional[asyncio.Queue] = None
 
     @lru_cache(maxsize=100)
     def normalize_url(self, url: str) -> str:
         return normalize_url(url)
 
-    async def fetch_page(self, url: str, session: aiohttp.ClientSession) -> List[str]:
-        async with self.semaphore:
-            current_time = time.time()
-            sleep_time = self.config.rate_limit - (current_time - self.last_request_time)
-            if sleep_time > 0:
-                await asyncio.sleep(sleep_time)
-            
-            self.last_request_time = time.time()
-            
-            try:
-                async with session.get(url, timeout=ClientTimeout(total=self.config.timeout)) as response:
-                    if response.status != 200:
-                        return []
-                    html = await response.text()
-                    soup = BeautifulSoup(html, 'html.parser')
-                    return [link.get('href') for link in soup.find_all('a') if link.get('href')]
-            except Exception as e:
-                print(f"Error fetching {url}: {e}")
-                return []
+    async def fetch_page(self, url: str, session: aiohttp.ClientSession) -> Optional[Tuple[List[str], Optional[int]]]:
+        """Fetch a page into the store and return its links and content fingerprint, or None if it could not be fetched"""
+        await self.rate_limiter.acquire(url)
+        try:
+            async with session.get(url, headers=self.store.conditional_headers(url),
+                                   timeout=ClientTimeout(total=self.config.timeout)) as response:
+                html = await response.text() if response.status == 200 else ""
+                count(requests=1, bytes=len(html.encode("utf-8")))
+                page = self.store.record(url, response.status, html, dict(response.headers))
+                if page is None:
+                    return None
+            return await asyncio.get_running_loop().run_in_executor(self.executor, parse_page, page.body)
+        except Exception as e:
+            print(f"Error fetching {url}: {e}")
+            return None
+
+    def near_duplicate_of(self, url: str, fingerprint: Optional[int]) -> Optional[str]:
+        """Accepted URL whose content matches this page's, remembering the page's fingerprint otherwise"""
+        if not self.config.skip_near_duplicates or fingerprint is None:
+            return None
+        original = self.fingerprints.find(fingerprint)
+        if original is not None:
+            self.duplicates[url] = original
+            return original
+        self.fingerprints.add(fingerprint, url)
+        return None
+
+    def resolve_link(self, page_url: str, link: str) -> Optional[str]:
+        """Absolute, normalized form of a link, or None if it can't be parsed (e.g. "https://[broken")"""
+        try:
+            full_link = (link if link.startswith("https") else
+                        f"{urlparse(page_url).scheme}:{link}" if link.startswith("//") else
+                        urljoin(page_url, link))
+            return self.normalize_url(full_link)
+        except ValueError:
+            return None
+
+    def should_crawl(self, url: str, base_url: str) -> bool:
+        return is_valid_url(url, self.config.schemes) and is_same_domain(base_url, url) and self.robots.can_fetch(url)
+
+    async def seed_from_sitemaps(self, session: aiohttp.ClientSession, base_url: str) -> int:
+        """Enqueue sitemap URLs listed in robots.txt (or /sitemap.xml) at depth 1"""
+        sitemaps = self.robots.sitemaps() or [urljoin(base_url, "/sitemap.xml")]
+        seeded = 0
+        for sitemap_url in sitemaps:
+            async for entry in iter_sitemap(session, sitemap_url, self.config.timeout,
+                                            acquire=self.rate_limiter.acquire):
+                try:
+                    url = self.normalize_url(entry.loc)
+                except ValueError:
+                    print(f"Skipping malformed sitemap URL {entry.loc!r}")
+                    continue
+                if not self.should_crawl(url, base_url):
+                    continue
+                if entry.lastmod is not None:
+                    self.lastmod[url] = entry.lastmod
+                if self.frontier.push(url, 1, entry.lastmod):
+                    seeded += 1
+                if seeded >= self.config.max_sitemap_urls:
+                    return seeded
+        return seeded
 
     async def crawl_url(self, url: str, depth: int, session: aiohttp.ClientSession, base_url: str) -> None:
-        if (depth > self.config.max_depth or 
-            url in self.visited or 
-            len(self.filtered_links) >= self.config.max_urls):
+        # Only fetch while accepted + in-flight pages can still fit in max_urls
+        max_urls = self.config.max_urls
+        async with self.slots:
+            await self.slots.wait_for(lambda: len(self.accepted) + self.in_flight < max_urls
+                                      or len(self.accepted) >= max_urls)
+            if len(self.accepted) >= max_urls:
+                return
+            self.in_flight += 1
+        fetched = None
+        accepted = False
+        try:
+            fetched = await self.fetch_page(url, session)
+        finally:
+            async with self.slots:
+                self.in_flight -= 1
+                # Near-duplicates free their slot for unique content, but their links are still followed
+                if fetched is not None and self.near_duplicate_of(url, fetched[1]) is None:
+                    self.accepted.append(url)
+                    accepted = True
+                self.slots.notify_all()
+        if fetched is None:
             return
+        if accepted and self.pages is not None:
+            await self.pages.put(self.store.get(url))
+        links = fetched[0]
 
-        self.visited.add(url)
-        links = await self.fetch_page(url, session)
-        tasks = []
-
+        # Links of the deepest pages are returned (and fetched) but not followed further
+        if depth > self.config.max_depth:
+            return
         for link in links:
-            if len(self.filtered_links) >= self.config.max_urls:
-                break
+            full_link = self.resolve_link(url, link)
+            if full_link is not None and self.should_crawl(full_link, base_url):
+                self.frontier.push(full_link, depth + 1, self.lastmod.get(full_link))
 
-            full_link = (link if link.startswith("https") else
-                        f"{urlparse(url).scheme}:{link}" if link.startswith("//") else
-                        urljoin(url, link))
-            
-            full_link = self.normalize_url(full_link)
-            
-            if (is_valid_url(full_link) and 
-                is_same_domain(base_url, full_link) and 
-                full_link not in self.visited):
-                self.filtered_links.add(full_link)
-                tasks.append(self.crawl_url(full_link, depth + 1, session, base_url))
+    async def worker(self, session: aiohttp.ClientSession, base_url: str) -> None:
+        while True:
+            url, depth = await self.frontier.get()
+            try:
+                await self.crawl_url(url, depth, session, base_url)
+            except Exception as e:
+                # A worker that exited would leave its share of the frontier unprocessed and join() hanging
+                print(f"Error crawling {url}: {type(e).__name__}: {e}")
+            finally:
+                self.frontier.task_done()
 
-        if tasks:
-            await asyncio.gather(*tasks)
+    async def crawl(self, start_url: str, pages: Optional[asyncio.Queue] = None) -> List[str]:
+        """Crawl the site and return the accepted URLs; with `pages`, each accepted Page is also put on
+        the queue as soon as it is fetched (waiting while the queue is full)"""
+        self.pages = pages
+        self.accepted = []
+        self.lastmod = {}
+        self.robots = RobotsRules()
+        self.frontier = Frontier(self.config.score_url)
+        self.fingerprints = SimHashIndex(self.config.near_duplicate_bits)
+        self.duplicates = {}
 
-    async def crawl(self, start_url: str) -> List[str]:
-        self.visited.clear()
-        self.filtered_links = {self.normalize_url(start_url)}
-        
         async with aiohttp.ClientSession(headers={
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9',
             'Accept-Language': 'en-US,en;q=0.5',
         }) as session:
-            await self.crawl_url(start_url, 0, session, start_url)
-        
-        return sorted(list(self.filtered_links))[:self.config.max_urls]
+            if self.config.respect_robots:
+                self.robots = await fetch_robots(session, start_url, self.config.timeout)
+                delay = self.robots.crawl_delay()
+                if delay is not None and delay > self.config.rate_limit:
+                    self.rate_limiter.set_interval(urlparse(start_url).netloc, delay)
+            if not self.robots.can_fetch(start_url):
+                print(f"robots.txt disallows {start_url}, nothing to crawl")
+                return []
+            self.frontier.push(self.normalize_url(start_url), 0)
+            if self.config.use_sitemaps:
+                seeded = await self.seed_from_sitemaps(session, start_url)
+                if seeded:
+                    print(f"Seeded {seeded} URLs from sitemaps")
+
+            pool = ProcessPoolExecutor if self.config.parse_in_processes else ThreadPoolExecutor
+            self.executor = pool(max_workers=self.config.parse_workers)
+            workers = [asyncio.create_task(self.worker(session, start_url))
+                       for _ in range(self.config.max_concurrent)]
+            try:
+                await self.frontier.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+        if self.duplicates:
+            print(f"Skipped {len(self.duplicates)} near-duplicate pages")
+        return sorted(self.accepted)[:self.config.max_urls]
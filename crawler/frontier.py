@@ -0,0 +1,47 @@
+import asyncio
+import itertools
+from datetime import datetime, timezone
+from typing import Callable, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+ScoreFn = Callable[[str, int, Optional[datetime]], float]
+
+PRIORITY_PATHS = ("/about", "/mission", "/donate", "/team", "/staff", "/board", "/impact", "/volunteer", "/contact")
+
+def default_score(url: str, depth: int, lastmod: Optional[datetime] = None) -> float:
+    """Lower scores are crawled first: shallow pages, then key nonprofit pages and
+    recently modified sitemap entries ahead of their depth peers"""
+    path = urlparse(url).path.lower()
+    bonus = 0.5 if any(path.startswith(prefix) for prefix in PRIORITY_PATHS) else 0.0
+    if lastmod is not None and (datetime.now(timezone.utc) - lastmod).days < 365:
+        bonus += 0.25
+    return depth - bonus
+
+class Frontier:
+    """Priority queue of URLs to crawl that drops URLs already enqueued"""
+
+    def __init__(self, score: ScoreFn = default_score):
+        self.score = score
+        self.seen: Set[str] = set()
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._counter = itertools.count()
+
+    def push(self, url: str, depth: int, lastmod: Optional[datetime] = None) -> bool:
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        self._queue.put_nowait((self.score(url, depth, lastmod), next(self._counter), url, depth))
+        return True
+
+    async def get(self) -> Tuple[str, int]:
+        _, _, url, depth = await self._queue.get()
+        return url, depth
+
+    def task_done(self) -> None:
+        self._queue.task_done()
+
+    async def join(self) -> None:
+        await self._queue.join()
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
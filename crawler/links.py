@@ -0,0 +1,64 @@
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+from .simhash import simhash
+
+class LinkExtractor(HTMLParser):
+    """Streaming parser that only collects <a href> values"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            for name, value in attrs:
+                if name == "href" and value:
+                    self.links.append(value)
+
+def extract_links(html: str) -> List[str]:
+    parser = LinkExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.links
+
+class PageParser(LinkExtractor):
+    """LinkExtractor that also collects the page's main text, leaving out navigation, headers and footers"""
+
+    SKIP_TAGS = {"script", "style", "noscript", "template"}
+    # Site chrome repeated on every page; headers and footers inside <article>/<main> belong to the content
+    CHROME_TAGS = {"nav", "aside", "header", "footer"}
+    CONTENT_TAGS = {"article", "main"}
+
+    def __init__(self):
+        super().__init__()
+        self.text: List[str] = []
+        self._skipping = 0
+        self._content = 0
+
+    def _is_chrome(self, tag: str) -> bool:
+        return tag in ("nav", "aside") or (tag in self.CHROME_TAGS and not self._content)
+
+    def handle_starttag(self, tag, attrs):
+        super().handle_starttag(tag, attrs)
+        if tag in self.CONTENT_TAGS:
+            self._content += 1
+        if tag in self.SKIP_TAGS or self._is_chrome(tag):
+            self._skipping += 1
+
+    def handle_endtag(self, tag):
+        if (tag in self.SKIP_TAGS or self._is_chrome(tag)) and self._skipping:
+            self._skipping -= 1
+        if tag in self.CONTENT_TAGS and self._content:
+            self._content -= 1
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.text.append(data)
+
+def parse_page(html: str) -> Tuple[List[str], Optional[int]]:
+    """Links of the page and a SimHash fingerprint of its main text"""
+    parser = PageParser()
+    parser.feed(html)
+    parser.close()
+    return parser.links, simhash(" ".join(parser.text))
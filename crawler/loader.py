@@ -0,0 +1,66 @@
+import asyncio
+import aiohttp
+from aiohttp import ClientTimeout
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterable, Optional
+
+from instrumentation import count
+from .models import LoaderConfig, Page
+from .page_store import PageStore
+
+@dataclass
+class LoadResult:
+    url: str
+    page: Optional[Page] = None
+    error: Optional[str] = None
+
+class PageLoader:
+    """Loads pages concurrently over one pooled session, yielding each as it finishes"""
+
+    def __init__(self, config: LoaderConfig, headers: Dict[str, str], store: Optional[PageStore] = None):
+        self.config = config
+        self.headers = headers
+        self.store = store if store is not None else PageStore()
+        self.semaphore = asyncio.Semaphore(config.max_concurrent)
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "PageLoader":
+        connector = aiohttp.TCPConnector(limit=self.config.max_concurrent, limit_per_host=self.config.limit_per_host)
+        self.session = aiohttp.ClientSession(headers=self.headers, connector=connector)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def fetch(self, url: str) -> LoadResult:
+        page = self.store.get(url)
+        if page is not None:
+            return LoadResult(url=url, page=page)
+
+        assert self.session is not None, "PageLoader must be used as an async context manager"
+        async with self.semaphore:
+            try:
+                async with self.session.get(url, headers=self.store.conditional_headers(url),
+                                            timeout=ClientTimeout(total=self.config.timeout)) as response:
+                    html = await response.text(errors="replace") if response.status == 200 else ""
+                    count(requests=1, bytes=len(html.encode("utf-8")))
+                    page = self.store.record(url, response.status, html, dict(response.headers))
+                    if page is None:
+                        return LoadResult(url=url, error=f"HTTP {response.status}")
+            except asyncio.TimeoutError:
+                return LoadResult(url=url, error=f"timed out after {self.config.timeout}s")
+            except Exception as e:
+                return LoadResult(url=url, error=f"{type(e).__name__}: {e}")
+
+        return LoadResult(url=url, page=page)
+
+    async def stream(self, urls: Iterable[str]) -> AsyncIterator[LoadResult]:
+        tasks = [asyncio.ensure_future(self.fetch(url)) for url in dict.fromkeys(urls)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -1,9 +1,47 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+import hashlib
+import time
+
+from .frontier import ScoreFn, default_score
 
 @dataclass
 class CrawlerConfig:
     max_depth: int = 2
     max_urls: int = 10
-    rate_limit: float = 0.5  # seconds between requests
+    rate_limit: float = 0.5  # seconds between requests to the same host
+    burst: int = 1  # requests a host may receive back to back before rate limiting applies
     timeout: int = 10
-    max_concurrent: int = 5
+    max_concurrent: int = 5  # worker tasks pulling from the frontier
+    score_url: ScoreFn = default_score  # frontier priority, lower is crawled first
+    parse_workers: int = 2  # link extraction runs off the event loop in this many workers
+    parse_in_processes: bool = False  # use processes instead of threads for link extraction
+    respect_robots: bool = True  # honour robots.txt Disallow and Crawl-delay
+    use_sitemaps: bool = True  # seed the frontier from sitemap.xml
+    max_sitemap_urls: int = 5000
+    schemes: Tuple[str, ...] = ("https",)  # URL schemes the crawler will follow
+    skip_near_duplicates: bool = True  # pages whose text matches an accepted page don't count toward max_urls
+    near_duplicate_bits: int = 3  # SimHash distance (out of 64 bits) still treated as the same content
+
+@dataclass
+class LoaderConfig:
+    max_concurrent: int = 10
+    limit_per_host: int = 5
+    timeout: int = 15  # seconds per page
+
+@dataclass
+class Page:
+    url: str
+    body: str
+    status: int = 200
+    headers: Dict[str, str] = field(default_factory=dict)
+    fetched_at: float = field(default_factory=time.time)
+    changed: bool = True  # False when the body matches the previous audit
+
+    @property
+    def content_hash(self) -> str:
+        return hashlib.sha256(self.body.encode("utf-8")).hexdigest()
+
+    def header(self, name: str) -> Optional[str]:
+        name = name.lower()
+        return next((value for key, value in self.headers.items() if key.lower() == name), None)
@@ -0,0 +1,138 @@
+import json
+import os
+import sqlite3
+import time
+from dataclasses import replace
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+from langchain_core.documents import Document
+
+from .models import Page
+from .utils import normalize_url
+
+DEFAULT_STORE_DIR = os.path.join(".cache", "pages")
+
+def site_store_path(url: str, root: str = DEFAULT_STORE_DIR) -> str:
+    return os.path.join(root, f"{urlparse(url).netloc.lower()}.sqlite")
+
+class PageStore:
+    """Pages fetched during an audit, keyed by normalized URL.
+
+    With a path, pages and their chunks are also persisted so the next audit of the
+    same site can send conditional requests and skip re-chunking unchanged pages.
+    Without one, page bodies live only in memory and earlier fetches come from there.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._pages: Dict[str, Page] = {}
+        self._persistent = bool(path)
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, body TEXT NOT NULL, status INTEGER NOT NULL, "
+            "headers TEXT NOT NULL, fetched_at REAL NOT NULL, content_hash TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "url TEXT PRIMARY KEY, content_hash TEXT NOT NULL, chunks TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    def put(self, page: Page) -> None:
+        key = normalize_url(page.url)
+        self._pages[key] = page
+        if not self._persistent:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+            (key, page.body, page.status, json.dumps(page.headers), page.fetched_at, page.content_hash),
+        )
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[Page]:
+        """Page fetched during the current audit"""
+        return self._pages.get(normalize_url(url))
+
+    def previous(self, url: str) -> Optional[Page]:
+        """Page as stored by an earlier audit, if any"""
+        if not self._persistent:
+            return self._pages.get(normalize_url(url))
+        row = self._conn.execute(
+            "SELECT url, body, status, headers, fetched_at FROM pages WHERE url = ?", (normalize_url(url),)
+        ).fetchone()
+        if row is None:
+            return None
+        url, body, status, headers, fetched_at = row
+        return Page(url=url, body=body, status=status, headers=json.loads(headers), fetched_at=fetched_at)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        previous = self.previous(url)
+        if previous is None:
+            return {}
+        headers = {}
+        etag = previous.header("ETag")
+        last_modified = previous.header("Last-Modified")
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def record(self, url: str, status: int, body: str, headers: Dict[str, str]) -> Optional[Page]:
+        """Store a fetch result, reusing the previous body on 304 Not Modified"""
+        previous = self.previous(url)
+        if status == 304 and previous is not None:
+            page = replace(previous, url=url, fetched_at=time.time(), changed=False)
+        elif status == 200:
+            page = Page(url=url, body=body, status=status, headers=headers)
+            page.changed = previous is None or previous.content_hash != page.content_hash
+        else:
+            return None
+        self.put(page)
+        return page
+
+    def get_chunks(self, page: Page) -> Optional[List[Document]]:
+        """Chunks stored for this exact page content by an earlier audit"""
+        row = self._conn.execute(
+            "SELECT chunks FROM chunks WHERE url = ? AND content_hash = ?",
+            (normalize_url(page.url), page.content_hash),
+        ).fetchone()
+        if row is None:
+            return None
+        return [Document(**chunk) for chunk in json.loads(row[0])]
+
+    def put_chunks(self, page: Page, chunks: List[Document]) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)",
+            (
+                normalize_url(page.url),
+                page.content_hash,
+                json.dumps([{"page_content": c.page_content, "metadata": c.metadata} for c in chunks]),
+            ),
+        )
+        self._conn.commit()
+
+    def get_meta(self, key: str) -> Optional[Any]:
+        """Site-level value saved by an earlier audit"""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put_meta(self, key: str, value: Any) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+        self._conn.commit()
+
+    def __contains__(self, url: str) -> bool:
+        return normalize_url(url) in self._pages
+
+    def __iter__(self) -> Iterator[Page]:
+        return iter(self._pages.values())
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,52 @@
+import asyncio
+import time
+from typing import Dict
+from urllib.parse import urlparse
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding at most `capacity` tokens"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        async with self._lock:
+            self._refill()
+            while self.tokens < tokens:
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+
+class HostRateLimiter:
+    """One token bucket per host, allowing a request every `interval` seconds with bursts of `burst`"""
+
+    def __init__(self, interval: float, burst: int = 1):
+        self.interval = interval
+        self.burst = burst
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def set_interval(self, host: str, interval: float) -> None:
+        host = host.lower()
+        if interval > 0:
+            self.buckets[host] = TokenBucket(1 / interval, self.burst)
+        else:
+            self.buckets.pop(host, None)
+
+    async def acquire(self, url: str) -> None:
+        host = urlparse(url).netloc.lower()
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            if self.interval <= 0:
+                return
+            self.set_interval(host, self.interval)
+            bucket = self.buckets[host]
+        await bucket.acquire()
@@ -0,0 +1,57 @@
+import aiohttp
+from aiohttp import ClientTimeout
+from typing import List, Optional
+from urllib.parse import urljoin
+from urllib.robotparser import RobotFileParser
+
+def _parse_crawl_delay(text: str) -> Optional[float]:
+    """Crawl-delay of the `*` group; RobotFileParser only understands whole seconds"""
+    in_default_group = False
+    for line in text.splitlines():
+        key, _, value = line.split("#", 1)[0].partition(":")
+        key, value = key.strip().lower(), value.strip()
+        if key == "user-agent":
+            in_default_group = value == "*"
+        elif key == "crawl-delay" and in_default_group:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+class RobotsRules:
+    """Crawl rules and sitemap locations from a site's robots.txt"""
+
+    def __init__(self, text: str = "", user_agent: str = "*"):
+        self.user_agent = user_agent
+        self.parser = RobotFileParser()
+        self.parser.parse(text.splitlines())
+        self._delay = _parse_crawl_delay(text)
+
+    def can_fetch(self, url: str) -> bool:
+        return self.parser.can_fetch(self.user_agent, url)
+
+    def crawl_delay(self) -> Optional[float]:
+        delay = self.parser.crawl_delay(self.user_agent)
+        return float(delay) if delay is not None else self._delay
+
+    def sitemaps(self) -> List[str]:
+        return self.parser.site_maps() or []
+
+async def fetch_robots(session: aiohttp.ClientSession, base_url: str, timeout: int = 10) -> RobotsRules:
+    """Fetch robots.txt, treating a missing or unreadable file as allowing everything.
+
+    A 401 or 403 means the site restricts access, so, as RobotFileParser.read does, everything is disallowed.
+    """
+    url = urljoin(base_url, "/robots.txt")
+    try:
+        async with session.get(url, timeout=ClientTimeout(total=timeout)) as response:
+            if response.status in (401, 403):
+                print(f"{url} returned {response.status}, treating the site as disallowing crawlers")
+                return RobotsRules("User-agent: *\nDisallow: /")
+            if response.status != 200:
+                return RobotsRules()
+            return RobotsRules(await response.text(errors="replace"))
+    except Exception as e:
+        print(f"Error fetching {url}: {e}")
+        return RobotsRules()
@@ -0,0 +1,61 @@
+import hashlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+BITS = 64
+BANDS = 4  # pages within 3 bits share at least one 16-bit band
+SAMPLE = 256  # shingles fingerprinted per page, keeping the cost flat on long pages
+_BAND_BITS = BITS // BANDS
+_MASK = (1 << _BAND_BITS) - 1
+
+def _word_hash(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+
+def simhash(text: str, shingle: int = 3) -> Optional[int]:
+    """64-bit SimHash of the text's word shingles, or None when the text is too short to fingerprint"""
+    words = text.lower().split()
+    if len(words) < shingle * 4:
+        return None
+    word_hashes = {word: _word_hash(word) for word in set(words)}
+    hashes = np.fromiter(map(word_hashes.__getitem__, words), dtype=np.uint64, count=len(words))
+    # Combine neighbouring word hashes into shingle hashes
+    shingles = hashes[:len(hashes) - shingle + 1].copy()
+    for offset in range(1, shingle):
+        shingles = shingles * np.uint64(0x9E3779B97F4A7C15) ^ hashes[offset:len(hashes) - shingle + 1 + offset]
+    # Bottom-k sample: near-duplicate pages share most of their smallest shingle hashes
+    shingles = np.unique(shingles)[:SAMPLE]
+    # Mix so every bit depends on the whole shingle
+    shingles ^= shingles >> np.uint64(31)
+    shingles *= np.uint64(0xBF58476D1CE4E5B9)
+    shingles ^= shingles >> np.uint64(29)
+    bits = np.unpackbits(shingles.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    majority = bits.sum(axis=0, dtype=np.int32) * 2 > len(shingles)
+    return int(np.packbits(majority, bitorder="little").view("<u8")[0])
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class SimHashIndex:
+    """Finds fingerprints within `max_distance` bits of one already added, using LSH bands"""
+
+    def __init__(self, max_distance: int = 3):
+        if max_distance >= BANDS:
+            raise ValueError(f"max_distance must be below {BANDS} for band lookups to find every match")
+        self.max_distance = max_distance
+        self.buckets: List[Dict[int, List[tuple]]] = [{} for _ in range(BANDS)]
+
+    def _bands(self, fingerprint: int):
+        return [(fingerprint >> (i * _BAND_BITS)) & _MASK for i in range(BANDS)]
+
+    def find(self, fingerprint: int) -> Optional[str]:
+        """URL of an added page whose fingerprint is within max_distance bits"""
+        for bucket, band in zip(self.buckets, self._bands(fingerprint)):
+            for other, url in bucket.get(band, ()):
+                if hamming(fingerprint, other) <= self.max_distance:
+                    return url
+        return None
+
+    def add(self, fingerprint: int, url: str) -> None:
+        for bucket, band in zip(self.buckets, self._bands(fingerprint)):
+            bucket.setdefault(band, []).append((fingerprint, url))
@@ -0,0 +1,87 @@
+import asyncio
+import zlib
+import aiohttp
+import xml.etree.ElementTree as ET
+from aiohttp import ClientTimeout
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Optional, Set
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+@dataclass
+class SitemapEntry:
+    loc: str
+    lastmod: Optional[datetime] = None
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def _child_text(elem: ET.Element, name: str) -> Optional[str]:
+    for child in elem:
+        if _local_name(child.tag) == name and child.text:
+            return child.text.strip()
+    return None
+
+def _drain(parser: ET.XMLPullParser, nested: List[str]) -> Iterator[SitemapEntry]:
+    for _, elem in parser.read_events():
+        name = _local_name(elem.tag)
+        if name == "url":
+            loc = _child_text(elem, "loc")
+            if loc:
+                yield SitemapEntry(loc=loc, lastmod=parse_lastmod(_child_text(elem, "lastmod")))
+            elem.clear()
+        elif name == "sitemap":
+            loc = _child_text(elem, "loc")
+            if loc:
+                nested.append(loc)
+            elem.clear()
+
+async def iter_sitemap(session: aiohttp.ClientSession, url: str, timeout: int = 10, max_sitemaps: int = 50,
+                       acquire: Optional[Callable[[str], Awaitable[None]]] = None) -> AsyncIterator[SitemapEntry]:
+    """Stream <url> entries from a sitemap, following sitemap indexes and gzipped files.
+
+    `acquire(url)` is awaited before every sitemap request, nested ones included, e.g. a rate limiter.
+    """
+    pending = [url]
+    seen: Set[str] = set()
+    while pending and len(seen) < max_sitemaps:
+        sitemap_url = pending.pop(0)
+        if sitemap_url in seen:
+            continue
+        seen.add(sitemap_url)
+        nested: List[str] = []
+        if acquire is not None:
+            await acquire(sitemap_url)
+        try:
+            async with session.get(sitemap_url, timeout=ClientTimeout(total=timeout)) as response:
+                if response.status != 200:
+                    continue
+                parser = ET.XMLPullParser(events=("end",))
+                decompressor = None
+                first = True
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    if first:
+                        first = False
+                        if chunk.startswith(GZIP_MAGIC):
+                            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    if decompressor is not None:
+                        chunk = decompressor.decompress(chunk)
+                    parser.feed(chunk)
+                    for entry in _drain(parser, nested):
+                        yield entry
+                parser.close()
+                for entry in _drain(parser, nested):
+                    yield entry
+        except (aiohttp.ClientError, ET.ParseError, zlib.error, asyncio.TimeoutError) as e:
+            print(f"Error reading sitemap {sitemap_url}: {e}")
+        pending.extend(nested)
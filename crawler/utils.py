@@ -1,5 +1,6 @@
 from urllib.parse import urlparse, urlunparse
 import re
+from typing import Tuple
 
 def normalize_url(url: str) -> str:
     parsed = urlparse(url)
@@ -12,9 +13,9 @@ def normalize_url(url: str) -> str:
     path = normalized.path[:-1] if normalized.path.endswith('/') else normalized.path
     return urlunparse(normalized._replace(path=path))
 
-def is_valid_url(url: str) -> bool:
+def is_valid_url(url: str, schemes: Tuple[str, ...] = ("https",)) -> bool:
     parsed = urlparse(url)
-    return parsed.scheme == "https" and not re.search(r'<%|%>', url)
+    return parsed.scheme in schemes and not re.search(r'<%|%>', url)
 
 def is_same_domain(url1: str, url2: str) -> bool:
     return urlparse(url1).netloc.lower() == urlparse(url2).netloc.lower()
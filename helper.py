@@ -3,14 +3,13 @@ from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
 from reportlab.lib.colors import Color
 import re
-from typing import List
-import aiohttp
+from typing import List, Optional
 import asyncio
-from langchain_community.document_loaders import AsyncHtmlLoader
-from langchain_community.document_transformers import Html2TextTransformer
 from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import os
+from crawler import LoaderConfig, Page, PageLoader, PageStore
+from retrieval.chunking import split_documents
+from retrieval.ingest import chunk_pages
 
 
 def create_pdf(content, output_filename, urls):
@@ -178,21 +177,23 @@ def create_pdf(content, output_filename, urls):
 
 
 
-def load_urls(urls:List[str]):
-    user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
-    successful_docs =  asyncio.run(lazy_load(user_agent, urls)) # type: ignore
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
+
+def load_urls(urls:List[str], store:Optional[PageStore]=None):
+    successful_docs =  asyncio.run(lazy_load(USER_AGENT, urls, store)) # type: ignore
     return successful_docs
 
+async def aload_urls(urls:List[str], store:Optional[PageStore]=None):
+    return await lazy_load(USER_AGENT, urls, store)
+
 
 def _splited_docs(docs:List[Document]):
-        html2text = Html2TextTransformer(ignore_links=False, ignore_images=False)
-        docs_transformed = html2text.transform_documents(docs)
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=200
-        )
-        return text_splitter.split_documents(docs_transformed)
+    return split_documents(docs)
+
+def _page_document(page:Page) -> Document:
+    return Document(page_content=page.body, metadata={"source": page.url})
 
-async def lazy_load(user_agent, urls):
+async def lazy_load(user_agent, urls, store:Optional[PageStore]=None):
     default_header_template = {
         'User-Agent': user_agent,
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*"
@@ -205,15 +206,20 @@ async def lazy_load(user_agent, urls):
 }
 
     successful_docs = []
-    for url in urls:
-        try:
-            loader = AsyncHtmlLoader([url], header_template=default_header_template, encoding="utf-8", raise_for_status=True)
-            docs = loader.load()
-            splited_docs = _splited_docs(docs)
-
-            successful_docs.extend(splited_docs)
-        except aiohttp.ClientConnectionError:
-            pass
+
+    async def collect(doc:Document):
+        successful_docs.append(doc)
+
+    async with PageLoader(LoaderConfig(), default_header_template, store) as loader:
+        async def loaded_pages():
+            async for result in loader.stream(urls):
+                if result.page is None:
+                    print(f"Error loading {result.url}: {result.error}")
+                    continue
+                yield result.page
+
+        # The same chunking stage as the ingest pipeline, fed by the loader instead of the crawler
+        await chunk_pages(loader.store, loaded_pages(), collect)
 
     return successful_docs # type: 
 
@@ -0,0 +1,184 @@
+"""Per-stage timing, request, token and cost accounting for an audit.
+
+A Trace is activated for the current context with `use_trace`; code anywhere in the
+pipeline then reports into it through `stage`, `count`, `record_llm` and
+`record_embedding`, which do nothing when no trace is active.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# USD per million tokens: (prompt, completion)
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "text-embedding-ada-002": (0.10, 0.0),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    wall_time: float = 0.0
+    requests: int = 0
+    bytes: int = 0
+    chunks: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+
+
+@dataclass
+class ModelStats:
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int = 0) -> float:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        prices = next((p for name, p in MODEL_PRICES.items() if model.startswith(name)), (0.0, 0.0))
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class Trace:
+    def __init__(self, audit_id: str):
+        self.audit_id = audit_id
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.stages: Dict[str, StageStats] = {}
+        self.models: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, name: str) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats()
+        return self.stages[name]
+
+    def add(self, stage_name: str, **counters: float) -> None:
+        with self._lock:
+            stats = self._stage(stage_name)
+            for key, value in counters.items():
+                setattr(stats, key, getattr(stats, key) + value)
+
+    def add_model(self, stage_name: str, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        self.add(stage_name, requests=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cost=cost)
+        with self._lock:
+            stats = self.models.setdefault(model, ModelStats())
+            stats.requests += 1
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+            stats.cost += cost
+
+    def wall_times(self) -> Dict[str, float]:
+        return {name: round(stats.wall_time, 3) for name, stats in self.stages.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "audit_id": self.audit_id,
+            "started_at": self.started_at,
+            "wall_time": round(end - self.started_at, 3),
+            "total_cost": round(sum(m.cost for m in self.models.values()), 6),
+            "stages": {name: asdict(stats) for name, stats in self.stages.items()},
+            "models": {name: asdict(stats) for name, stats in self.models.items()},
+        }
+
+    def write_json(self, path: str) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def to_prometheus(self) -> str:
+        audit = self.audit_id.replace("\\", "\\\\").replace('"', '\\"')
+        lines = []
+        for metric, attr, help_text in (
+            ("audit_stage_seconds", "wall_time", "Wall time spent in the stage"),
+            ("audit_stage_calls_total", "calls", "Times the stage was entered"),
+            ("audit_stage_requests_total", "requests", "HTTP or model requests made in the stage"),
+            ("audit_stage_bytes_total", "bytes", "Bytes fetched in the stage"),
+            ("audit_stage_chunks_total", "chunks", "Chunks produced in the stage"),
+            ("audit_stage_prompt_tokens_total", "prompt_tokens", "Prompt tokens sent in the stage"),
+            ("audit_stage_completion_tokens_total", "completion_tokens", "Completion tokens received in the stage"),
+            ("audit_stage_cost_usd", "cost", "Estimated model cost of the stage"),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {'gauge' if attr in ('wall_time', 'cost') else 'counter'}")
+            for name, stats in self.stages.items():
+                lines.append(f'{metric}{{audit="{audit}",stage="{name}"}} {getattr(stats, attr)}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_stage: ContextVar[str] = ContextVar("current_stage", default="other")
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace: Trace) -> Iterator[Trace]:
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.finished_at = time.time()
+        _current_trace.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Attribute wall time and everything counted inside the block to `name`"""
+    token = _current_stage.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, calls=1, wall_time=time.perf_counter() - start)
+
+
+def count(**counters: float) -> None:
+    """Add to the counters (requests, bytes, chunks) of the current stage"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(_current_stage.get(), **counters)
+
+
+def record_llm(model: str, message: Any) -> None:
+    """Record token usage of a chat model response (an AIMessage with usage_metadata)"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    usage = getattr(message, "usage_metadata", None) or {}
+    trace.add_model(_current_stage.get(), model, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+
+
+def record_embedding(model: str, tokens: int) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_model(_current_stage.get(), model, tokens, 0)
+
+
+def model_name(llm: Any) -> str:
+    return str(getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__)
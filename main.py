@@ -1,7 +1,10 @@
-from langchain_openai import ChatOpenAI
-from agent import Agent, MainGraphState
+from agent import Agent, get_initial_state
 from retriver import Retriver
 from helper import create_pdf, save_graph_image
+from instrumentation import Trace, stage, use_trace
+from checkpointer import get_checkpointer, invoke_resumable, thread_config
+from rate_limits import chat_model
+from typing import Optional
 from dotenv import load_dotenv
 
 
@@ -10,28 +13,34 @@ load_dotenv()
 
 
 
-def analyze_organization(url: str):
-    initial_state = MainGraphState(
-        stakeholders="",
-        resarch_result="",
-        errors=[]
-    )
-    
-    # Create and run workflow
-    retriver = Retriver(url)
-    llm = ChatOpenAI(model="gpt-4o", temperature=0)
-    agent = Agent(retriver=retriver, llm=llm)
-    workflow = agent.create_analysis_graph()
-    app = workflow.compile()
+def analyze_organization(url: str, incremental: bool = True, prometheus: bool = False, audit_id: Optional[str] = None):
+    """Audit the site; rerunning an audit id that was interrupted resumes it from its last completed step"""
+    initial_state = get_initial_state()
+    audit_id = audit_id or url
+    trace = Trace(url)
 
-    #save_graph_image(app.get_graph().draw_mermaid_png(), "images/main_graph.png")
+    with use_trace(trace):
+        # Create and run workflow
+        retriver = Retriver(url, incremental=incremental)
+        llm = chat_model("gpt-4o", temperature=0)
+        agent = Agent(retriver=retriver, llm=llm)
+        workflow = agent.create_analysis_graph()
+        app = workflow.compile(checkpointer=get_checkpointer())
 
-    
-    
-    # Run analysis
-    final_state = app.invoke(initial_state)
-    create_pdf(final_state["resarch_result"], "output.pdf", retriver.urls)
+        #save_graph_image(app.get_graph().draw_mermaid_png(), "images/main_graph.png")
+
+        
+        
+        # Run analysis
+        final_state = invoke_resumable(app, initial_state, thread_config(audit_id))
+        with stage("report"):
+            create_pdf(final_state["resarch_result"], "output.pdf", retriver.urls)
     print(final_state)
+
+    trace.write_json("output_reports/output_trace.json")
+    if prometheus:
+        trace.write_prometheus("output_reports/output_trace.prom")
+    print(f"Trace saved to output_reports/output_trace.json (estimated cost ${trace.to_dict()['total_cost']})")
     
 
 
@@ -0,0 +1,438 @@
+"""Process-wide scheduling of OpenAI requests against the account's rate limits.
+
+Every chat and embedding client built by `chat_model` / `embedding_model` sends its requests
+through one `RateLimitScheduler`. Before a request is sent, its tokens are estimated with
+tiktoken and it waits for room in the model's requests-per-minute and tokens-per-minute token
+buckets. Waiting requests are served by priority (interactive audits before batch ones), then
+in arrival order. A 429 response pauses every request to that model for a jittered, growing
+delay before the request is retried, instead of letting each client retry on its own.
+
+Limits start from MODEL_LIMITS, overridden by OPENAI_RATE_LIMITS (for example
+"gpt-4o=10000:2000000,text-embedding=10000:10000000", as requests:tokens per minute), and are
+replaced by the account's real limits from the x-ratelimit-limit-* headers of the first response.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import openai
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from retrieval.tokens import get_token_counter
+
+INTERACTIVE = 0
+BATCH = 1
+
+# (requests per minute, tokens per minute) by model prefix, the longest matching prefix wins.
+# Conservative until a response reports the account's own limits.
+MODEL_LIMITS: Dict[str, Tuple[int, int]] = {
+    "gpt-4o-mini": (500, 200_000),
+    "gpt-4o": (500, 30_000),
+    "text-embedding": (3_000, 1_000_000),
+}
+DEFAULT_LIMITS = (500, 30_000)
+COMPLETION_TOKENS = 1_000  # assumed completion length when a chat request sets no max_tokens
+POLL_INTERVAL = 0.01  # seconds between checks by requests queued behind another one
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_priority: ContextVar[int] = ContextVar("request_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def use_priority(priority: int) -> Iterator[None]:
+    """Schedule the OpenAI requests made inside the block with this priority (lower is served first)"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+_llm_slots: ContextVar[Optional[asyncio.Semaphore]] = ContextVar("llm_slots", default=None)
+
+
+@contextmanager
+def use_llm_slots(slots: Optional[asyncio.Semaphore]) -> Iterator[None]:
+    """Cap the chat requests in flight inside the block, across every task sharing `slots`"""
+    token = _llm_slots.set(slots)
+    try:
+        yield
+    finally:
+        _llm_slots.reset(token)
+
+
+def llm_slot() -> Any:
+    """Async context manager holding one of the current LLM slots for a chat request, if any are set"""
+    return _llm_slots.get() or nullcontext()
+
+
+def limits_from_env(value: Optional[str] = None) -> Dict[str, Tuple[int, int]]:
+    """Parse "model=requests:tokens,..." from OPENAI_RATE_LIMITS"""
+    value = os.getenv("OPENAI_RATE_LIMITS", "") if value is None else value
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        try:
+            model, budget = item.split("=")
+            requests, tokens = budget.split(":")
+            limits[model.strip()] = (int(requests), int(tokens))
+        except ValueError:
+            print(f"Ignoring malformed OPENAI_RATE_LIMITS entry {item!r}, expected model=requests:tokens")
+    return limits
+
+
+class TokenBucket:
+    """Holds up to `capacity` units, refilled continuously at `rate` units per second"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available; a request larger than the bucket waits for a full one"""
+        self._refill(now)
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def resize(self, capacity: float, rate: float, now: float) -> None:
+        self._refill(now)
+        # A larger bucket starts with the extra room available
+        self.level = min(capacity, self.level + max(0.0, capacity - self.capacity))
+        self.capacity = capacity
+        self.rate = rate
+
+    def give_back(self, amount: float) -> None:
+        # Negative amounts charge a request that used more than estimated; the level may go below zero
+        self.level = min(self.capacity, self.level + amount)
+
+
+@dataclass
+class SchedulerStats:
+    requests: int = 0
+    rate_limited: int = 0  # 429 responses received
+    waited: float = 0.0  # seconds requests spent queued
+
+
+class RateLimitScheduler:
+    """RPM and TPM token buckets per model, shared by every OpenAI request in the process"""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, int]]] = None, period: float = 60.0,
+                 burst: float = 0.1, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.limits = limits if limits is not None else {**MODEL_LIMITS, **limits_from_env()}
+        self.period = period  # seconds the limits apply over; shorter than a minute only in tests
+        # OpenAI enforces per-minute limits over shorter windows, so only this fraction of a period's
+        # budget may be sent at once and the rest is paced evenly
+        self.burst = burst
+        self.max_retries = max_retries  # retries of 429s, server errors and dropped connections
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = SchedulerStats()
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._queues: Dict[str, List[Tuple[int, int]]] = {}  # model -> heap of (priority, ticket)
+        self._paused_until: Dict[str, float] = {}
+        self._learned: Dict[str, Tuple[int, int]] = {}  # model -> limits reported by OpenAI
+        self._tickets = itertools.count()
+
+    def model_limits(self, model: str) -> Tuple[int, int]:
+        if model in self._learned:
+            return self._learned[model]
+        matches = [name for name in self.limits if model.startswith(name)]
+        return self.limits[max(matches, key=len)] if matches else DEFAULT_LIMITS
+
+    def _bucket_pair(self, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        if model not in self._buckets:
+            self._buckets[model] = tuple(TokenBucket(max(1.0, limit * self.burst), limit / self.period)
+                                         for limit in self.model_limits(model))
+        return self._buckets[model]
+
+    def learn(self, model: str, headers: httpx.Headers) -> None:
+        """Adopt the account's limits for the model from a response's x-ratelimit-limit-* headers"""
+        try:
+            limits = (int(headers["x-ratelimit-limit-requests"]), int(headers["x-ratelimit-limit-tokens"]))
+        except (KeyError, ValueError):
+            return
+        with self._lock:
+            if self._learned.get(model) == limits:
+                return
+            self._learned[model] = limits
+            now = time.monotonic()
+            for bucket, limit in zip(self._bucket_pair(model), limits):
+                bucket.resize(max(1.0, limit * self.burst), limit / self.period, now)
+
+    def _enqueue(self, model: str, priority: int) -> Tuple[int, int]:
+        entry = (priority, next(self._tickets))
+        with self._lock:
+            heapq.heappush(self._queues.setdefault(model, []), entry)
+        return entry
+
+    def _dequeue(self, model: str, entry: Tuple[int, int], waited: float) -> None:
+        with self._lock:
+            self.stats.waited += waited
+            queue = self._queues[model]
+            if entry in queue:
+                queue.remove(entry)
+                heapq.heapify(queue)
+
+    def _poll(self, model: str, entry: Tuple[int, int], tokens: int) -> float:
+        """0 once the request may be sent (its budget is then taken), else seconds to wait before polling again"""
+        with self._lock:
+            now = time.monotonic()
+            queue = self._queues[model]
+            requests, token_bucket = self._bucket_pair(model)
+            wait = max(requests.wait_time(1, now), token_bucket.wait_time(tokens, now),
+                       self._paused_until.get(model, 0.0) - now)
+            if queue[0] != entry:
+                return max(wait, POLL_INTERVAL)
+            if wait > 0:
+                return wait
+            requests.take(1)
+            token_bucket.take(tokens)
+            heapq.heappop(queue)
+            self.stats.requests += 1
+            return 0.0
+
+    def acquire(self, model: str, tokens: int, priority: Optional[int] = None) -> None:
+        """Block until the request fits the model's limits and every higher priority request has gone"""
+        entry = self._enqueue(model, _priority.get() if priority is None else priority)
+        start = time.monotonic()
+        try:
+            while (wait := self._poll(model, entry, tokens)) > 0:
+                time.sleep(wait)
+        finally:
+            self._dequeue(model, entry, time.monotonic() - start)
+
+    async def aacquire(self, model: str, tokens: int, priority: Optional[int] = None) -> None:
+        """Async counterpart of acquire"""
+        entry = self._enqueue(model, _priority.get() if priority is None else priority)
+        start = time.monotonic()
+        try:
+            while (wait := self._poll(model, entry, tokens)) > 0:
+                await asyncio.sleep(wait)
+        finally:
+            self._dequeue(model, entry, time.monotonic() - start)
+
+    def settle(self, model: str, estimated: int, used: int) -> None:
+        """Correct the token bucket once the response reports the tokens the request actually used"""
+        with self._lock:
+            self._bucket_pair(model)[1].give_back(estimated - used)
+
+    def backoff(self, model: str, attempt: int, retry_after: Optional[float] = None,
+                rate_limited: bool = True) -> float:
+        """Pause every request to the model after a 429 (or a server error), for a jittered delay that doubles per attempt"""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        with self._lock:
+            self.stats.rate_limited += rate_limited
+            self._paused_until[model] = max(self._paused_until.get(model, 0.0), time.monotonic() + delay)
+        return delay
+
+
+def _text_tokens(model: str, value: Any) -> int:
+    if isinstance(value, str):
+        return get_token_counter(model)(value)
+    if isinstance(value, list):
+        if value and all(isinstance(item, int) for item in value):
+            return len(value)  # already tokenized, as OpenAIEmbeddings sends its input
+        return sum(_text_tokens(model, item) for item in value)
+    if isinstance(value, dict):
+        return _text_tokens(model, value.get("text") or value.get("content") or "")
+    return 0
+
+
+def request_cost(request: httpx.Request) -> Tuple[Optional[str], int, bool]:
+    """Model, estimated tokens and whether the response streams, for a chat or embedding request"""
+    if request.method != "POST" or not request.url.path.endswith(("/chat/completions", "/embeddings")):
+        return None, 0, False
+    try:
+        body = json.loads(request.read())
+    except ValueError:
+        return None, 0, False
+    model = body.get("model", "")
+    if request.url.path.endswith("/embeddings"):
+        return model, _text_tokens(model, body.get("input", "")), False
+    tokens = sum(_text_tokens(model, message.get("content") or "") + 4 for message in body.get("messages", []))
+    # Tool and response schemas count towards the prompt
+    for key in ("tools", "functions", "response_format"):
+        if key in body:
+            tokens += get_token_counter(model)(json.dumps(body[key]))
+    # OpenAI counts the requested completion length towards the limit
+    tokens += body.get("max_completion_tokens") or body.get("max_tokens") or COMPLETION_TOKENS
+    return model, tokens * body.get("n", 1), bool(body.get("stream"))
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(response.headers[header]) * scale
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+def _used_tokens(response: httpx.Response) -> Optional[int]:
+    try:
+        return int(response.json()["usage"]["total_tokens"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """httpx transport that schedules OpenAI requests and retries 429s, server errors and dropped connections.
+
+    Clients using it are built with max_retries=0, so this is the only retry layer.
+    """
+
+    def __init__(self, scheduler: Optional[RateLimitScheduler] = None, transport: Optional[httpx.BaseTransport] = None):
+        self._scheduler = scheduler  # None uses the process-wide scheduler
+        self.transport = transport or httpx.HTTPTransport(limits=openai.DEFAULT_CONNECTION_LIMITS)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        scheduler = self._scheduler or get_rate_limit_scheduler()
+        model, tokens, stream = request_cost(request)
+        if model is None:
+            return self.transport.handle_request(request)
+        attempt = 0
+        while True:
+            scheduler.acquire(model, tokens)
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                if attempt >= scheduler.max_retries:
+                    raise
+                scheduler.backoff(model, attempt, rate_limited=False)
+                attempt += 1
+                continue
+            scheduler.learn(model, response.headers)
+            if response.status_code in RETRY_STATUSES and attempt < scheduler.max_retries:
+                response.close()
+                scheduler.backoff(model, attempt, _retry_after(response), response.status_code == 429)
+                attempt += 1
+                continue
+            if response.status_code == 200 and not stream:
+                response.read()
+                used = _used_tokens(response)
+                if used is not None:
+                    scheduler.settle(model, tokens, used)
+            return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of RateLimitedTransport, with one connection pool per event loop"""
+
+    def __init__(self, scheduler: Optional[RateLimitScheduler] = None):
+        self._scheduler = scheduler
+        # Pooled connections belong to the loop that opened them, and audits may run several loops in turn
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = \
+            weakref.WeakKeyDictionary()
+
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        if loop not in self._transports:
+            self._transports[loop] = httpx.AsyncHTTPTransport(limits=openai.DEFAULT_CONNECTION_LIMITS)
+        return self._transports[loop]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        scheduler = self._scheduler or get_rate_limit_scheduler()
+        transport = self._transport()
+        model, tokens, stream = request_cost(request)
+        if model is None:
+            return await transport.handle_async_request(request)
+        attempt = 0
+        while True:
+            await scheduler.aacquire(model, tokens)
+            try:
+                response = await transport.handle_async_request(request)
+            except httpx.TransportError:
+                if attempt >= scheduler.max_retries:
+                    raise
+                scheduler.backoff(model, attempt, rate_limited=False)
+                attempt += 1
+                continue
+            scheduler.learn(model, response.headers)
+            if response.status_code in RETRY_STATUSES and attempt < scheduler.max_retries:
+                await response.aclose()
+                scheduler.backoff(model, attempt, _retry_after(response), response.status_code == 429)
+                attempt += 1
+                continue
+            if response.status_code == 200 and not stream:
+                await response.aread()
+                used = _used_tokens(response)
+                if used is not None:
+                    scheduler.settle(model, tokens, used)
+            return response
+
+    async def aclose(self) -> None:
+        transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+_default_scheduler: Optional[RateLimitScheduler] = None
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_rate_limit_scheduler() -> RateLimitScheduler:
+    """Process-wide scheduler shared by every client from chat_model and embedding_model"""
+    global _default_scheduler
+    if _default_scheduler is None:
+        _default_scheduler = RateLimitScheduler()
+    return _default_scheduler
+
+
+def set_rate_limit_scheduler(scheduler: Optional[RateLimitScheduler]) -> None:
+    """Replace the process-wide scheduler, e.g. with the account's own limits; None restores the default"""
+    global _default_scheduler
+    _default_scheduler = scheduler
+
+
+def get_http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(transport=RateLimitedTransport(), timeout=openai.DEFAULT_TIMEOUT,
+                                    follow_redirects=True)
+    return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(transport=AsyncRateLimitedTransport(), timeout=openai.DEFAULT_TIMEOUT,
+                                               follow_redirects=True)
+    return _async_http_client
+
+
+def chat_model(model: str = "gpt-4o", temperature: float = 0, **kwargs: Any) -> ChatOpenAI:
+    """ChatOpenAI whose requests go through the process-wide rate-limit scheduler"""
+    kwargs.setdefault("max_retries", 0)  # the transport retries; SDK retries would multiply its attempts
+    return ChatOpenAI(model=model, temperature=temperature, http_client=get_http_client(),
+                      http_async_client=get_async_http_client(), **kwargs)
+
+
+def embedding_model(**kwargs: Any) -> OpenAIEmbeddings:
+    """OpenAIEmbeddings whose requests go through the process-wide rate-limit scheduler"""
+    kwargs.setdefault("max_retries", 0)  # the transport retries; SDK retries would multiply its attempts
+    return OpenAIEmbeddings(http_client=get_http_client(), http_async_client=get_async_http_client(), **kwargs)
@@ -1,8 +1,13 @@
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
+from typing import List, Optional, Tuple, Type
+from langchain_core.runnables import RunnableConfig
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from pydantic import BaseModel
 
 
+from instrumentation import model_name, record_llm, stage
+from rate_limits import chat_model, llm_slot
+from research.llm_cache import LLMCache
 from research.models.research_findings import ListResearchFindings
 from research.models.task_analysis import Queries, TaskAnalysis
 from research.workflow.state import ResearchState
@@ -11,12 +16,71 @@ from retriver import Retriver
 
 
 class Research:
-    def __init__(self, retriver:Retriver):
-        self.llm = ChatOpenAI(model="gpt-4o", temperature=0)
+    def __init__(self, retriver:Optional[Retriver]=None, cache:Optional[LLMCache]=None, llm=None,
+                 min_confidence_gain:float=0.05):
+        self.llm = llm if llm is not None else chat_model("gpt-4o", temperature=0)
         self.retriver = retriver
+        self.cache = cache if cache is not None else LLMCache()
+        self.min_confidence_gain = min_confidence_gain  # smaller gains after a follow-up search end the loop
+
+    def get_retriver(self, config:Optional[RunnableConfig]=None) -> Retriver:
+        """Retriever passed for this run under config["configurable"]["retriver"], else the default one"""
+        retriver = ((config or {}).get("configurable") or {}).get("retriver", self.retriver)
+        if retriver is None:
+            raise ValueError("No retriver configured for this research run")
+        return retriver
+
+    def _invoke(self, messages:List[BaseMessage], schema:Optional[Type[BaseModel]]=None):
+        """Invoke the LLM, answering from the response cache when the same request was seen before"""
+        key = self.cache.key(self.llm, messages, schema)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return schema.model_validate_json(cached) if schema is not None else AIMessage(content=cached)
+
+        if schema is not None:
+            output = self.llm.with_structured_output(schema, include_raw=True).invoke(messages)
+            record_llm(model_name(self.llm), output["raw"])
+            response = output["parsed"]
+            if isinstance(response, schema):
+                self.cache.put(key, response.model_dump_json())
+        else:
+            response = self.llm.invoke(messages)
+            record_llm(model_name(self.llm), response)
+            self.cache.put(key, str(response.content))
+        return response
+
+    async def _ainvoke(self, messages:List[BaseMessage], schema:Optional[Type[BaseModel]]=None):
+        """Async counterpart of _invoke"""
+        key = self.cache.key(self.llm, messages, schema)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return schema.model_validate_json(cached) if schema is not None else AIMessage(content=cached)
+
+        if schema is not None:
+            async with llm_slot():
+                output = await self.llm.with_structured_output(schema, include_raw=True).ainvoke(messages)
+            record_llm(model_name(self.llm), output["raw"])
+            response = output["parsed"]
+            if isinstance(response, schema):
+                self.cache.put(key, response.model_dump_json())
+        else:
+            async with llm_slot():
+                response = await self.llm.ainvoke(messages)
+            record_llm(model_name(self.llm), response)
+            self.cache.put(key, str(response.content))
+        return response
 
     def planner(self, state: ResearchState) -> ResearchState:
         """Split the task research task into small chanks"""
+        with stage("research.planner"):
+            return self._apply_planner(state, self._invoke(self._planner_messages(state), TaskAnalysis))
+
+    async def aplanner(self, state: ResearchState) -> ResearchState:
+        """Split the task research task into small chanks"""
+        with stage("research.planner"):
+            return self._apply_planner(state, await self._ainvoke(self._planner_messages(state), TaskAnalysis))
+
+    def _planner_messages(self, state: ResearchState) -> List[BaseMessage]:
         task = state["task"]
 
         # Add your logic here
@@ -46,7 +110,9 @@ class Research:
                 2. Search queries to find relevant information
                 Present your analysis in a clear structure with both questions and queries""")
         ]
-        response = self.llm.with_structured_output(TaskAnalysis).invoke(messages)
+        return messages
+
+    def _apply_planner(self, state: ResearchState, response) -> ResearchState:
         if not isinstance(response, TaskAnalysis):
             raise ValueError("Invalid response from LLM")
 
@@ -54,24 +120,45 @@ class Research:
         state["search_queries"] = response.search_queries.search_queries
         return state
 
-    def search_context(self, state: ResearchState) -> ResearchState:
+    def search_context(self, state: ResearchState, config: RunnableConfig) -> ResearchState:
         """Search for relevant context based on the task and search queries"""
-        state["context"] = []
-        
-        queries = state["search_queries"]
-        for query in queries:
-            response = self.retriver.get_relevant_documents(query)
-            state["context"].append(response)
-        
+        with stage("research.search_context"):
+            return self._apply_search_context(state, self.get_retriver(config).get_context(state["search_queries"]))
+
+    async def asearch_context(self, state: ResearchState, config: RunnableConfig) -> ResearchState:
+        """Search for relevant context based on the task and search queries"""
+        with stage("research.search_context"):
+            return self._apply_search_context(state, await self.get_retriver(config).aget_context(state["search_queries"]))
+
+    def _apply_search_context(self, state: ResearchState, context: List[Tuple[str, str]]) -> ResearchState:
+        seen = set(state["seen_context"])
+        new = [chunk for chunk in dict.fromkeys(chunk for chunk, _ in context) if chunk not in seen]
+        state["context"] = [text for _, text in context]
+        state["new_context"] = len(new)
+        state["seen_context"] = state["seen_context"] + new
+        if state["current_iteration"] > 1 and not new:
+            # The follow-up queries found only chunks already analyzed, so another analysis would learn nothing
+            state["stop_reason"] = "no_new_evidence"
         return state
 
+    def has_new_evidence(self, state: ResearchState) -> bool:
+        """Whether the last search found context worth analyzing"""
+        return state["stop_reason"] != "no_new_evidence"
+
     def optimize_search(self, state: ResearchState) -> ResearchState:
         """Optimize search results based on previous findings"""
+        with stage("research.optimize_search"):
+            return self._apply_optimize_search(state, self._invoke(self._optimize_search_messages(state), Queries))
+
+    async def aoptimize_search(self, state: ResearchState) -> ResearchState:
+        """Optimize search results based on previous findings"""
+        with stage("research.optimize_search"):
+            return self._apply_optimize_search(state, await self._ainvoke(self._optimize_search_messages(state), Queries))
 
+    def _optimize_search_messages(self, state: ResearchState) -> List[BaseMessage]:
         task = state["task"]
         missing_guiding_questions =  state["guiding_questions"]
         low_confidence_findings = [str(x) for x in state["lower_findings"]]
-        state["current_iteration"] += 1
 
 
         SYSTEM_PROMPT = """You are a search query optimization expert. Your task is to refine and enhance search queries to ensure maximum effectiveness. Your refined queries should:
@@ -107,18 +194,29 @@ class Research:
 
         """
 
-        response = self.llm.with_structured_output(Queries).invoke([SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=HUMAN_PROMPT)])
+        return [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=HUMAN_PROMPT)]
 
+    def _apply_optimize_search(self, state: ResearchState, response) -> ResearchState:
         if not isinstance(response, Queries):
             raise ValueError("Invalid response from LLM")
         
+        state["current_iteration"] += 1
         state["search_queries"] = response.search_queries
 
         return state
 
     def analyze_finfind(self, state: ResearchState) -> ResearchState:
         """Analyze research context and extract structured findings"""
-        context = state["context"]
+        with stage("research.analyze_finfind"):
+            return self._apply_analyze_finfind(state, self._invoke(self._analyze_finfind_messages(state), ListResearchFindings))
+
+    async def aanalyze_finfind(self, state: ResearchState) -> ResearchState:
+        """Analyze research context and extract structured findings"""
+        with stage("research.analyze_finfind"):
+            return self._apply_analyze_finfind(state, await self._ainvoke(self._analyze_finfind_messages(state), ListResearchFindings))
+
+    def _analyze_finfind_messages(self, state: ResearchState) -> List[BaseMessage]:
+        context = "\n\n---\n\n".join(state["context"])
         guiding_questions = state["guiding_questions"]
 
         SYSTEM_PROMPT = """
@@ -149,9 +247,10 @@ class Research:
         Guiding Questions:
         {guiding_questions}"""
 
-        prompt = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=HUMAN_PROMPT)]
-        response = self.llm.with_structured_output(ListResearchFindings).invoke(prompt)
+        return [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=HUMAN_PROMPT)]
 
+    def _apply_analyze_finfind(self, state: ResearchState, response) -> ResearchState:
+        guiding_questions = state["guiding_questions"]
         if not isinstance(response, ListResearchFindings):
             raise ValueError("Invalid response from LLM")
         
@@ -166,18 +265,55 @@ class Research:
                     state["lower_findings"].append(finding)
 
         state["guiding_questions"] = guiding_questions
+        confidence = self._confidence(state)
+        state["confidence_delta"] = confidence - state["confidence"]
+        state["confidence"] = confidence
+        state["stop_reason"] = self._stop_reason(state)
         return state
 
+    def _confidence(self, state: ResearchState) -> float:
+        """Mean confidence over the guiding questions: answered ones, then the best low-confidence finding, else 0"""
+        best = {}
+        for finding in state["lower_findings"]:
+            best[finding.question] = max(best.get(finding.question, 0.0), finding.confidence)
+        scores = [finding.confidence for finding in state["findings"]]
+        scores += [best.get(question, 0.0) for question in state["guiding_questions"]]
+        return sum(scores) / len(scores) if scores else 0.0
+
+    def _stop_reason(self, state: ResearchState) -> str:
+        if len(state["guiding_questions"]) == 0:
+            return "answered"
+        if state["current_iteration"] >= state["max_iterations"]:
+            return "max_iterations"
+        if state["current_iteration"] > 1 and state["confidence_delta"] < self.min_confidence_gain:
+            return "converged"
+        return ""
+
     def check_completion(self, state: ResearchState) -> bool:
-        """Check if research is complete based on multiple conditions"""
-        within_iterations = state["current_iteration"] < state["max_iterations"]
-        no_remaining_questions = len(state["guiding_questions"]) == 0
-        
-        # Return True only if all conditions are met
-        return not within_iterations or  no_remaining_questions
+        """Research is complete once every question is answered, the iterations run out, or confidence stops improving"""
+        return bool(state["stop_reason"])
 
     def summarize_findings(self, state: ResearchState) -> ResearchState:
         """Summarize research findings and evaluate the level of the findings"""
+        with stage("research.summarize_findings"):
+            self._report_stop(state)
+            response = self._invoke(self._summarize_findings_messages(state))
+            state["answer"] = str(response.content)
+            return state
+
+    async def asummarize_findings(self, state: ResearchState) -> ResearchState:
+        """Summarize research findings and evaluate the level of the findings"""
+        with stage("research.summarize_findings"):
+            self._report_stop(state)
+            response = await self._ainvoke(self._summarize_findings_messages(state))
+            state["answer"] = str(response.content)
+            return state
+
+    def _report_stop(self, state: ResearchState) -> None:
+        print(f"Research stopped after {state['current_iteration']} of {state['max_iterations']} iterations: "
+              f"{state['stop_reason']} (confidence {state['confidence']:.2f}, {len(state['seen_context'])} chunks seen)")
+
+    def _summarize_findings_messages(self, state: ResearchState) -> List[BaseMessage]:
         system = """You are a research summarization expert. 
             Your task is to summarize the key findings of the research process and evaluate the level of the findings"""
 
@@ -195,9 +331,4 @@ class Research:
                 {state['output_format']}"""
 
 
-        messages = [SystemMessage(content=system),HumanMessage(content=human)]
-
-        response = self.llm.invoke(messages)
-        state["answer"] = str(response.content)
-
-        return state
\ No newline at end of file
+        return [SystemMessage(content=system),HumanMessage(content=human)]
\ No newline at end of file
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Sequence, Type
+
+from langchain_core.messages import BaseMessage
+from pydantic import BaseModel
+
+DEFAULT_LLM_CACHE_PATH = os.path.join(".cache", "llm.sqlite")
+
+
+class LLMCache:
+    """SQLite cache of LLM responses keyed by model, temperature, output schema and messages"""
+
+    def __init__(self, path: str = DEFAULT_LLM_CACHE_PATH, ttl: Optional[float] = 7 * 24 * 3600,
+                 max_entries: int = 10_000):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(llm: Any, messages: Sequence[BaseMessage], schema: Optional[Type[BaseModel]] = None) -> str:
+        payload = {
+            "model": getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__,
+            "temperature": getattr(llm, "temperature", None),
+            "schema": schema.model_json_schema() if schema is not None else None,
+            "messages": [(message.type, message.content) for message in messages],
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, value, now, now))
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
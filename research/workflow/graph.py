@@ -1,44 +1,115 @@
+from typing import Optional
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import START, END, StateGraph
 from helper import save_graph_image
 from research.analyzer import Research
+from research.llm_cache import LLMCache
 from research.workflow.state import ResearchState, get_initial_state
 from retriver import Retriver
+from checkpointer import ainvoke_resumable, get_checkpointer, invoke_resumable, thread_config
 
 
 
-def run_research_workflow(retriver:Retriver, task:str, output_foramt:str, max_iteration:int ) -> str:
-    """Run the research workflow."""
-    graph = create_research_graph(retriver)
-    workflow = graph.compile()
-    
-    # Print workflow graph
-    print(workflow.get_graph().draw_ascii())
-    #save_graph_image(workflow.get_graph().draw_mermaid_png(), "images/researcher_graph.png")
-    
-    # Run workflow
-    response = workflow.invoke(get_initial_state(task, output_foramt, max_iteration))
-    return response["answer"]
+class ResearchEngine:
+    """Compiled research graph and pooled LLM client, reused across tasks; the retriever is given per run.
 
-def create_research_graph(retriver:Retriver) -> StateGraph:
-    """Create the research workflow graph."""
+    Runs given a thread_id are checkpointed, and an interrupted run on the same thread resumes
+    from its last completed node.
+    """
+
+    def __init__(self, llm=None, cache:Optional[LLMCache]=None, show_graph:bool=False,
+                 checkpointer:Optional[BaseCheckpointSaver]=None):
+        self.research = Research(cache=cache, llm=llm)
+        self.graph = create_research_graph(self.research)
+        self.workflow = self.graph.compile()
+        self.checkpointer = checkpointer
+        self._resumable = None
+
+        if show_graph:
+            print(self.workflow.get_graph().draw_ascii())
+            #save_graph_image(self.workflow.get_graph().draw_mermaid_png(), "images/researcher_graph.png")
+
+    @property
+    def resumable(self):
+        """The research graph compiled with a checkpointer, built on first use"""
+        if self._resumable is None:
+            self._resumable = self.graph.compile(checkpointer=self.checkpointer or get_checkpointer())
+        return self._resumable
+
+    @staticmethod
+    def run_config(retriver:Retriver, thread_id:Optional[str]=None) -> RunnableConfig:
+        if thread_id is None:
+            return {"configurable": {"retriver": retriver}}
+        return thread_config(thread_id, retriver=retriver)
+
+    def run(self, retriver:Retriver, task:str, output_format:str, max_iteration:int, thread_id:Optional[str]=None) -> str:
+        state = get_initial_state(task, output_format, max_iteration)
+        if thread_id is None:
+            response = self.workflow.invoke(state, self.run_config(retriver))
+        else:
+            response = invoke_resumable(self.resumable, state, self.run_config(retriver, thread_id))
+        return response["answer"]
+
+    async def arun(self, retriver:Retriver, task:str, output_format:str, max_iteration:int, thread_id:Optional[str]=None) -> str:
+        state = get_initial_state(task, output_format, max_iteration)
+        if thread_id is None:
+            response = await self.workflow.ainvoke(state, self.run_config(retriver))
+        else:
+            response = await ainvoke_resumable(self.resumable, state, self.run_config(retriver, thread_id))
+        return response["answer"]
+
+
+_default_engine: Optional[ResearchEngine] = None
+
+def get_research_engine() -> ResearchEngine:
+    """Process-wide engine shared by run_research_workflow and arun_research_workflow"""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = ResearchEngine()
+    return _default_engine
+
+def set_research_engine(engine: Optional[ResearchEngine]) -> None:
+    """Replace the process-wide engine, e.g. with one using a different LLM; None restores the default"""
+    global _default_engine
+    _default_engine = engine
+
+
+def run_research_workflow(retriver:Retriver, task:str, output_foramt:str, max_iteration:int, thread_id:Optional[str]=None) -> str:
+    """Run the research workflow, checkpointed under thread_id when one is given."""
+    return get_research_engine().run(retriver, task, output_foramt, max_iteration, thread_id)
+
+async def arun_research_workflow(retriver:Retriver, task:str, output_foramt:str, max_iteration:int, thread_id:Optional[str]=None) -> str:
+    """Run the research workflow without blocking the event loop."""
+    return await get_research_engine().arun(retriver, task, output_foramt, max_iteration, thread_id)
+
+def create_research_graph(research:Research) -> StateGraph:
+    """Create the research workflow graph; every node runs with both invoke and ainvoke."""
     graph = StateGraph(ResearchState)
-    research = Research(retriver)
 
     # Add nodes
-    graph.add_node("planner", research.planner)
-    graph.add_node("search_context", research.search_context)
-    graph.add_node("optimize_search", research.optimize_search)
-    graph.add_node("analyze_finfind", research.analyze_finfind)
-    graph.add_node("summarize_findings", research.summarize_findings)
+    graph.add_node("planner", RunnableLambda(research.planner, afunc=research.aplanner, name="planner"))
+    graph.add_node("search_context", RunnableLambda(research.search_context, afunc=research.asearch_context, name="search_context"))
+    graph.add_node("optimize_search", RunnableLambda(research.optimize_search, afunc=research.aoptimize_search, name="optimize_search"))
+    graph.add_node("analyze_finfind", RunnableLambda(research.analyze_finfind, afunc=research.aanalyze_finfind, name="analyze_finfind"))
+    graph.add_node("summarize_findings", RunnableLambda(research.summarize_findings, afunc=research.asummarize_findings, name="summarize_findings"))
 
     # Add edges
     graph.add_edge(START, "planner")
     graph.add_edge("planner", "search_context")
-    graph.add_edge("search_context", "analyze_finfind")
     graph.add_edge("optimize_search", "search_context")
     graph.add_edge("summarize_findings", END)
 
 
+    graph.add_conditional_edges(
+        "search_context",
+        research.has_new_evidence,
+        {
+            True: "analyze_finfind",
+            False: "summarize_findings"
+        }
+    )
+
     graph.add_conditional_edges(
         "analyze_finfind",
         research.check_completion,
@@ -13,6 +13,11 @@ class ResearchState(TypedDict):
     lower_findings: List[ResearchFindings]
     max_iterations: int
     current_iteration: int
+    seen_context: List[str]  # ids of every chunk retrieved so far (see retrieval.chunk_id)
+    new_context: int  # chunks in the last search that were not retrieved before
+    confidence: float  # mean confidence over the guiding questions, unanswered ones counting as 0
+    confidence_delta: float  # change in confidence from the previous analysis
+    stop_reason: str  # why the iteration loop ended, empty while it runs
     answer: str
 
 def get_initial_state(task: str, output_format:str ,max_iterations:int) -> ResearchState:
@@ -27,5 +32,10 @@ def get_initial_state(task: str, output_format:str ,max_iterations:int) -> Resea
         lower_findings=[],
         max_iterations=max_iterations,
         current_iteration=1,
+        seen_context=[],
+        new_context=0,
+        confidence=0.0,
+        confidence_delta=0.0,
+        stop_reason="",
         answer=""
     )
@@ -0,0 +1,8 @@
+from .embedding_cache import CachedEmbeddings, EmbeddingCache
+from .vector_index import VectorIndex, site_index_path
+from .keyword_index import KeywordIndex, reciprocal_rank_fusion, tokenize
+from .context_builder import ContextBuilder, ContextChunk, chunk_id
+from .tokens import get_token_counter
+from .boilerplate import BoilerplateDetector, claim_lines, strip_boilerplate
+from .chunking import ChunkingPool, get_chunking_pool, page_text, split_documents, split_text
+from .ingest import IngestConfig, IngestPipeline, chunk_pages
@@ -0,0 +1,65 @@
+import hashlib
+import re
+from collections import Counter
+from typing import Container, Dict, Iterable, Optional, Set
+
+
+def line_hash(line: str) -> str:
+    normalized = " ".join(line.lower().split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class BoilerplateDetector:
+    """Finds text lines repeated across most pages of a site: navigation, headers, footers, cookie banners"""
+
+    def __init__(self, threshold: float = 0.5, min_pages: int = 10, known: Iterable[str] = ()):
+        self.threshold = threshold  # fraction of pages a line must appear on
+        self.min_pages = min_pages  # fewer pages than this are too few to tell boilerplate from content
+        self.known = set(known)  # lines already found to be boilerplate, e.g. by the last audit of the site
+        self.pages = 0
+        self.counts: Counter = Counter()
+
+    def observe(self, text: str) -> None:
+        self.counts.update({line_hash(line) for line in text.splitlines() if line.strip()})
+        self.pages += 1
+
+    def enough_pages(self) -> bool:
+        return self.pages >= self.min_pages
+
+    def boilerplate(self) -> Set[str]:
+        return self.known | {h for h in self.counts if h in self}
+
+    def __contains__(self, h: object) -> bool:
+        """Whether the line is known boilerplate, or is judging by every page observed so far"""
+        if h in self.known:
+            return True
+        seen = self.counts.get(h, 0)
+        return self.enough_pages() and seen > 1 and seen >= self.threshold * self.pages
+
+
+def strip_boilerplate(text: str, boilerplate: Container[str], owners: Dict[str, str], url: str,
+                      applied: Set[str]) -> str:
+    """Remove boilerplate lines, except on the one page that keeps each line's copy for the whole site.
+
+    `owners` maps a line to that page's URL, and the first page seen with the line claims it.
+    Lines judged boilerplate are added to `applied`.
+    """
+    lines = []
+    for line in text.splitlines():
+        h = line_hash(line) if line.strip() else None
+        if h is not None and h in boilerplate:
+            applied.add(h)
+            if owners.setdefault(h, url) != url:
+                continue
+        lines.append(line)
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def claim_lines(text: str, owners: Dict[str, str], url: str, only: Optional[Container[str]] = None) -> None:
+    """Record the page as keeping its lines (those in `only`, if given) unless another page already does"""
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        h = line_hash(line)
+        if only is None or h in only:
+            owners.setdefault(h, url)
@@ -0,0 +1,120 @@
+import asyncio
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Callable, List, Optional, Tuple
+
+from langchain_community.document_transformers import Html2TextTransformer
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from crawler import Page
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Built once per process (the main one, or each pool worker) and reused for every page
+_html2text: Optional[Html2TextTransformer] = None
+_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+
+def _init_worker(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> None:
+    global _html2text, _splitter
+    _html2text = Html2TextTransformer(ignore_links=False, ignore_images=False)
+    _splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def split_documents(docs: List[Document]) -> List[Document]:
+    """Convert HTML documents to text and split them into chunks"""
+    if _html2text is None or _splitter is None:
+        _init_worker()
+    return _splitter.split_documents(_html2text.transform_documents(docs))
+
+
+def page_text(url: str, html: str) -> Document:
+    """Convert a page to text without splitting it"""
+    if _html2text is None:
+        _init_worker()
+    return _html2text.transform_documents([Document(page_content=html, metadata={"source": url})])[0]
+
+
+def split_text(doc: Document) -> List[Document]:
+    if _splitter is None:
+        _init_worker()
+    return _splitter.split_documents([doc])
+
+
+class ChunkingPool:
+    """HTML-to-text conversion in a pool of worker processes, created once and reused"""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+    async def stream(self, pages: AsyncIterable[Page], task: Callable[[str, str], Any] = page_text,
+                     limit: Optional[int] = None) -> AsyncIterator[Tuple[Page, Any]]:
+        """Run `task(url, html)` on pages as they arrive, yielding each result as soon as a worker finishes it.
+
+        By default the result is the page converted to text. It is split in a thread of the main process
+        once its boilerplate is stripped (see retrieval.ingest.chunk_pages). At most `limit` pages
+        (twice the workers by default) are converting or waiting to be consumed, so a slow consumer
+        stops pages being taken from the source.
+        """
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(limit or self.workers * 2)
+        finished: asyncio.Queue = asyncio.Queue()
+        outstanding = 0
+
+        async def feed() -> None:
+            nonlocal outstanding
+            source = pages.__aiter__()
+            try:
+                while True:
+                    # Take a slot before the next page, so none is pulled while downstream is full
+                    await slots.acquire()
+                    try:
+                        page = await source.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    future = loop.run_in_executor(self.executor, task, page.url, page.body)
+                    future.add_done_callback(lambda f, page=page: finished.put_nowait((page, f)))
+                    outstanding += 1
+            finally:
+                finished.put_nowait(None)
+
+        feeder = asyncio.create_task(feed())
+        feeding = True
+        try:
+            while feeding or outstanding:
+                item = await finished.get()
+                if item is None:
+                    feeding = False
+                    continue
+                outstanding -= 1
+                page, future = item
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error chunking {page.url}: {e}")
+                    slots.release()
+                    continue
+                yield page, result
+                # Released only once the consumer asks for the next result
+                slots.release()
+            await feeder
+        finally:
+            feeder.cancel()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_default_pool: Optional[ChunkingPool] = None
+
+def get_chunking_pool() -> ChunkingPool:
+    """Process-wide pool shared by every load, shut down when the interpreter exits"""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = ChunkingPool()
+        atexit.register(_default_pool.close)
+    return _default_pool
@@ -0,0 +1,120 @@
+import hashlib
+from dataclasses import dataclass
+from typing import List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .tokens import get_token_counter
+
+
+@dataclass
+class ContextChunk:
+    doc: Document
+    score: float  # best relevance to any query: cosine, or BM25 / fused rank scaled by each query's best match
+    vector: Optional[np.ndarray]  # normalized embedding, None when retrieved by keywords only
+
+
+def chunk_id(doc: Document) -> str:
+    """Identity of a chunk: a hash of its full text, before any overlap with its neighbours is stripped"""
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def _shingles(text: str, size: int = 5) -> Set[int]:
+    words = text.lower().split()
+    return {hash(" ".join(words[i:i + size])) for i in range(max(1, len(words) - size + 1))}
+
+
+def _overlap(head: str, tail: str, min_overlap: int, max_overlap: int) -> int:
+    """Length of the longest suffix of head that is also a prefix of tail"""
+    for size in range(min(len(head), len(tail), max_overlap), min_overlap - 1, -1):
+        if head.endswith(tail[:size]):
+            return size
+    return 0
+
+
+class ContextBuilder:
+    """Deduplicates retrieved chunks, orders them by MMR and packs them into a token budget"""
+
+    def __init__(self, token_budget: int = 6000, lambda_mult: float = 0.7, near_duplicate: float = 0.8,
+                 min_overlap: int = 50, max_overlap: int = 400, model: str = "gpt-4o"):
+        self.token_budget = token_budget
+        self.lambda_mult = lambda_mult
+        self.near_duplicate = near_duplicate
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap  # the splitter overlaps chunks by 200 characters
+        self.count_tokens = get_token_counter(model)
+
+    def build(self, candidates: List[ContextChunk]) -> List[str]:
+        return [text for _, text in self.pack(candidates)]
+
+    def pack(self, candidates: List[ContextChunk]) -> List[Tuple[str, str]]:
+        """(chunk id, text) of each chunk packed, in MMR order"""
+        unique = self._dedupe(candidates)
+        packed: List[Tuple[str, str]] = []
+        packed_docs: List[Document] = []
+        used = 0
+        for chunk in self._mmr(unique):
+            text = self._strip_overlaps(chunk.doc, packed_docs)
+            if not text.strip():
+                continue
+            tokens = self.count_tokens(text)
+            if used + tokens > self.token_budget:
+                continue
+            used += tokens
+            packed.append((chunk_id(chunk.doc), text))
+            packed_docs.append(chunk.doc)
+        return packed
+
+    def _dedupe(self, candidates: List[ContextChunk]) -> List[ContextChunk]:
+        """Drop exact repeats and chunks whose shingles mostly match a better-scoring chunk"""
+        kept: List[ContextChunk] = []
+        kept_shingles: List[Set[int]] = []
+        seen_hashes: Set[str] = set()
+        for chunk in sorted(candidates, key=lambda c: c.score, reverse=True):
+            digest = chunk_id(chunk.doc)
+            if digest in seen_hashes:
+                continue
+            seen_hashes.add(digest)
+            shingles = _shingles(chunk.doc.page_content)
+            if any(len(shingles & other) / len(shingles | other) >= self.near_duplicate for other in kept_shingles):
+                continue
+            kept.append(chunk)
+            kept_shingles.append(shingles)
+        return kept
+
+    def _mmr(self, chunks: List[ContextChunk]) -> List[ContextChunk]:
+        """Order chunks by maximal marginal relevance: relevant to the queries, unlike those already picked"""
+        if not chunks:
+            return []
+        if any(chunk.vector is None for chunk in chunks):
+            return chunks  # without embeddings, keep the score order from _dedupe
+        vectors = np.stack([chunk.vector for chunk in chunks]).astype(np.float32)
+        relevance = np.array([chunk.score for chunk in chunks], dtype=np.float32)
+        similarity = vectors @ vectors.T
+        remaining = list(range(len(chunks)))
+        order: List[int] = []
+        max_similarity = np.full(len(chunks), -np.inf, dtype=np.float32)
+        while remaining:
+            redundancy = np.where(np.isfinite(max_similarity[remaining]), max_similarity[remaining], 0.0)
+            scores = self.lambda_mult * relevance[remaining] - (1 - self.lambda_mult) * redundancy
+            best = remaining.pop(int(np.argmax(scores)))
+            order.append(best)
+            max_similarity = np.maximum(max_similarity, similarity[best])
+        return [chunks[i] for i in order]
+
+    def _strip_overlaps(self, doc: Document, packed_docs: List[Document]) -> str:
+        """Remove text this chunk shares with an already packed neighbour from the same page"""
+        text = doc.page_content
+        source: Optional[str] = doc.metadata.get("source")
+        for other_doc in packed_docs:
+            if source is None or other_doc.metadata.get("source") != source:
+                continue
+            other_text = other_doc.page_content
+            head = _overlap(other_text, text, self.min_overlap, self.max_overlap)
+            if head:
+                text = text[head:]
+            tail = _overlap(text, other_text, self.min_overlap, self.max_overlap)
+            if tail:
+                text = text[:-tail]
+        return text
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from instrumentation import record_embedding
+from .tokens import get_token_counter
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "embeddings.sqlite")
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by the hash of (model name, text), evicted least-recently-used first"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 500_000):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        keys = [self.key(model, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        now = time.time()
+        rows = [
+            (self.key(model, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends texts missing from the cache to the underlying model"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, batch_size: int = 1000):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.batch_size = batch_size
+        self.model = str(getattr(embeddings, "model", type(embeddings).__name__))
+        self.count_tokens = get_token_counter(self.model)
+
+    def _record(self, batch: List[str]) -> None:
+        record_embedding(self.model, sum(self.count_tokens(text) for text in batch))
+
+    def _missing(self, texts: List[str], cached: List[Optional[List[float]]]) -> List[str]:
+        return list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+
+    def _merge(self, texts: List[str], cached: List[Optional[List[float]]], fresh: Dict[str, List[float]]) -> List[List[float]]:
+        return [vector if vector is not None else fresh[text] for text, vector in zip(texts, cached)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached = self.cache.get_many(self.model, texts)
+        fresh: Dict[str, List[float]] = {}
+        missing = self._missing(texts, cached)
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            vectors = self.embeddings.embed_documents(batch)
+            self._record(batch)
+            self.cache.put_many(self.model, batch, vectors)
+            fresh.update(zip(batch, vectors))
+        return self._merge(texts, cached, fresh)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached = self.cache.get_many(self.model, texts)
+        fresh: Dict[str, List[float]] = {}
+        missing = self._missing(texts, cached)
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            vectors = await self.embeddings.aembed_documents(batch)
+            self._record(batch)
+            self.cache.put_many(self.model, batch, vectors)
+            fresh.update(zip(batch, vectors))
+        return self._merge(texts, cached, fresh)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
@@ -0,0 +1,176 @@
+import asyncio
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from crawler import CrawlerConfig, Page, PageStore, URLCrawler
+from instrumentation import count, stage
+from .boilerplate import BoilerplateDetector, claim_lines, strip_boilerplate
+from .chunking import get_chunking_pool, page_text, split_text
+from .keyword_index import KeywordIndex
+from .vector_index import VectorIndex
+
+
+@dataclass
+class IngestConfig:
+    page_queue: int = 32  # crawled pages waiting to be chunked, and at most as many more being converted
+    chunk_queue: int = 512  # chunks waiting to be embedded
+    embed_batch: int = 128  # chunks per embedding request
+    embed_linger: float = 0.05  # seconds to wait for a batch to fill before sending it partly full
+
+
+async def chunk_pages(store: PageStore, pages: AsyncIterable[Page], put: Callable[[Document], Awaitable[None]],
+                      limit: Optional[int] = None) -> None:
+    """Convert, strip boilerplate from and split pages as they arrive, passing each chunk to `put`.
+
+    Unchanged pages reuse their stored chunks. Boilerplate lines are those saved by the last audit
+    of the site, and those found on most of the pages converted so far once there are enough of
+    them to tell; pages are never held back to learn it. `limit` bounds the pages converting at once.
+    """
+    pool = get_chunking_pool()
+    stored = store.get_meta("boilerplate") or []
+    boilerplate = BoilerplateDetector(known=stored)
+    # Boilerplate line -> URL of the one page keeping a copy of it, carried over between audits
+    owners: Dict[str, str] = store.get_meta("boilerplate_owners") or {}
+    applied: Set[str] = set(stored)
+    unchanged = converted = 0
+
+    async def emit(page: Page, text: Document) -> None:
+        nonlocal converted
+        converted += 1
+        boilerplate.observe(text.page_content)
+        if not boilerplate.enough_pages():
+            # Too early to tell boilerplate apart; remember where its first copies went
+            claim_lines(text.page_content, owners, page.url)
+        text.page_content = strip_boilerplate(text.page_content, boilerplate, owners, page.url, applied)
+        # Splitting is light; a thread keeps it from queueing behind conversions in the process pool
+        page_chunks = await asyncio.to_thread(split_text, text)
+        store.put_chunks(page, page_chunks)
+        count(chunks=len(page_chunks))
+        for doc in page_chunks:
+            await put(doc)
+
+    async def changed_pages() -> AsyncIterator[Page]:
+        nonlocal unchanged
+        async for page in pages:
+            stored_chunks = store.get_chunks(page) if not page.changed else None
+            if stored_chunks is None:
+                yield page
+                continue
+            unchanged += 1
+            count(chunks=len(stored_chunks))
+            for doc in stored_chunks:
+                # The reused page still holds its copies, so changed pages don't add more
+                claim_lines(doc.page_content, owners, page.url, applied)
+                await put(doc)
+
+    async for page, text in pool.stream(changed_pages(), page_text, limit):
+        await emit(page, text)
+
+    if applied:
+        # Saved as applied, so the next audit strips exactly what this one did
+        store.put_meta("boilerplate", sorted(applied))
+        store.put_meta("boilerplate_owners", {h: url for h, url in owners.items() if h in applied})
+    if unchanged:
+        print(f"Reused chunks for {unchanged} unchanged pages")
+    if converted and applied:
+        print(f"Stripped {len(applied)} boilerplate lines repeated across pages")
+
+
+class IngestPipeline:
+    """Crawls, chunks and embeds a site as overlapping stages joined by bounded queues.
+
+    Pages are chunked as soon as the crawler accepts them and chunks are embedded in
+    micro-batches, so the index is ready shortly after the crawl ends. A full queue makes
+    the stage before it wait, which keeps memory flat on large sites.
+    """
+
+    def __init__(self, store: PageStore, embeddings: Optional[Embeddings], index: VectorIndex,
+                 config: Optional[IngestConfig] = None, crawler_config: Optional[CrawlerConfig] = None,
+                 keywords: Optional[KeywordIndex] = None, crawl_slots: Optional[asyncio.Semaphore] = None,
+                 embedding_slots: Optional[asyncio.Semaphore] = None, previous: Optional[VectorIndex] = None):
+        self.store = store
+        self.embeddings = embeddings  # None indexes keywords only, without calling the embedding API
+        self.index = index
+        self.keywords = keywords
+        self.config = config or IngestConfig()
+        self.crawler_config = crawler_config or CrawlerConfig()
+        # Shared with other pipelines to cap sites crawling, and embedding requests in flight, at once
+        self.crawl_slots = crawl_slots or nullcontext()
+        self.embedding_slots = embedding_slots or nullcontext()
+        self.previous = previous  # index saved by the last audit; chunks it holds are not embedded again
+        self.reused = 0  # chunks whose vectors came from the previous index
+        self.docs: List[Document] = []
+
+    async def run(self, url: str) -> Tuple[List[str], List[Document]]:
+        """Ingest the site into the index and return the crawled URLs and the indexed chunks"""
+        pages: asyncio.Queue = asyncio.Queue(self.config.page_queue)
+        chunks: asyncio.Queue = asyncio.Queue(self.config.chunk_queue)
+        tasks = [
+            asyncio.create_task(self._crawl(url, pages)),
+            asyncio.create_task(self._chunk(pages, chunks)),
+            asyncio.create_task(self._embed(chunks)),
+        ]
+        try:
+            urls, _, _ = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return urls, self.docs
+
+    async def _crawl(self, url: str, pages: asyncio.Queue) -> List[str]:
+        try:
+            async with self.crawl_slots:
+                with stage("crawl"):
+                    return await URLCrawler(self.crawler_config, self.store).crawl(url, pages)
+        finally:
+            await pages.put(None)
+
+    async def _pages(self, pages: asyncio.Queue) -> AsyncIterator[Page]:
+        while (page := await pages.get()) is not None:
+            yield page
+
+    async def _chunk(self, pages: asyncio.Queue, chunks: asyncio.Queue) -> None:
+        try:
+            with stage("load"):
+                await chunk_pages(self.store, self._pages(pages), chunks.put, self.config.page_queue)
+        finally:
+            await chunks.put(None)
+
+    async def _embed(self, chunks: asyncio.Queue) -> None:
+        with stage("embed"):
+            done = False
+            while not done:
+                batch = []
+                doc = await chunks.get()
+                while doc is not None:
+                    batch.append(doc)
+                    if len(batch) >= self.config.embed_batch:
+                        break
+                    try:
+                        doc = await asyncio.wait_for(chunks.get(), self.config.embed_linger)
+                    except asyncio.TimeoutError:
+                        break
+                done = doc is None
+                if batch:
+                    if self.embeddings is not None:
+                        self.index.add(batch, await self._vectors(batch))
+                    if self.keywords is not None:
+                        self.keywords.add(batch)
+                    self.docs.extend(batch)
+
+    async def _vectors(self, batch: List[Document]) -> List[List[float]]:
+        """Embeddings of the batch, copied from the previous index where it holds the same chunk"""
+        rows = self.previous.lookup(batch) if self.previous is not None else [None] * len(batch)
+        missing = [doc.page_content for doc, row in zip(batch, rows) if row is None]
+        embedded: List[List[float]] = []
+        if missing:
+            async with self.embedding_slots:
+                embedded = await self.embeddings.aembed_documents(missing)
+        self.reused += len(batch) - len(missing)
+        fresh = iter(embedded)
+        return [self.previous.matrix[row] if row is not None else next(fresh) for row in rows]
@@ -0,0 +1,116 @@
+import re
+from array import array
+from itertools import chain
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+_TOKEN = re.compile(r"\w+")
+
+
+def _fold(token: str) -> str:
+    # Dropping a trailing "s" lets "donates" match "donate" and "reports" match "report"
+    return token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_fold(token) for token in _TOKEN.findall(text.lower())]
+
+
+class KeywordIndex:
+    """BM25 index over chunks, with postings in flat arrays: one slice of row positions and term counts per term"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: List[Document] = []
+        self.terms: Dict[str, int] = {}  # term -> term id
+        self._word_terms: Dict[str, int] = {}  # word as written -> id of its folded term
+        # One (term id, row, count) posting per distinct term of each chunk, in the order chunks were added
+        self._term_ids = array("I")
+        self._rows = array("I")
+        self._counts = array("I")
+        self._lengths = array("I")  # tokens per chunk
+        self._built = 0  # chunks covered by the arrays below
+        self.offsets = np.zeros(1, dtype=np.int64)  # postings of term t are [offsets[t], offsets[t + 1])
+        self.postings = np.empty(0, dtype=np.int32)
+        self.frequencies = np.empty(0, dtype=np.float32)
+        self.idf = np.empty(0, dtype=np.float32)
+        self.norms = np.empty(0, dtype=np.float32)  # k1 * (1 - b + b * length / average length) per chunk
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, docs: Sequence[Document]) -> None:
+        if not docs:
+            return
+        doc_words = [_TOKEN.findall(doc.page_content.lower()) for doc in docs]
+        for word in set().union(*doc_words).difference(self._word_terms):
+            self._word_terms[word] = self.terms.setdefault(_fold(word), len(self.terms))
+        lengths = np.fromiter(map(len, doc_words), dtype=np.int64, count=len(docs))
+        total = int(lengths.sum())
+        terms = np.fromiter(map(self._word_terms.__getitem__, chain.from_iterable(doc_words)),
+                            dtype=np.int64, count=total)
+        rows = np.repeat(np.arange(len(self.docs), len(self.docs) + len(docs), dtype=np.int64), lengths)
+        # Count each (row, term) pair at once instead of word by word
+        pairs, counts = np.unique(rows * len(self.terms) + terms, return_counts=True)
+        self._term_ids.frombytes((pairs % len(self.terms)).astype(np.uint32).tobytes())
+        self._rows.frombytes((pairs // len(self.terms)).astype(np.uint32).tobytes())
+        self._counts.frombytes(counts.astype(np.uint32).tobytes())
+        self._lengths.frombytes(lengths.astype(np.uint32).tobytes())
+        self.docs.extend(docs)
+
+    def _build(self) -> None:
+        """Group the postings by term; rebuilt on the first search after chunks are added"""
+        if self._built == len(self.docs):
+            return
+        term_ids = np.frombuffer(self._term_ids, dtype=np.uint32)
+        # A stable sort keeps each term's rows in ascending order
+        order = np.argsort(term_ids, kind="stable")
+        self.postings = np.frombuffer(self._rows, dtype=np.uint32)[order].astype(np.int32)
+        self.frequencies = np.frombuffer(self._counts, dtype=np.uint32)[order].astype(np.float32)
+        document_frequency = np.bincount(term_ids, minlength=len(self.terms))
+        self.offsets = np.concatenate(([0], np.cumsum(document_frequency)))
+        total = len(self.docs)
+        self.idf = np.log1p((total - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+        average = max(float(lengths.mean()), 1.0)
+        self.norms = (self.k1 * (1 - self.b + self.b * lengths / average)).astype(np.float32)
+        self._built = total
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for the query"""
+        self._build()
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term = self.terms.get(token)
+            if term is None or term >= len(self.idf):
+                continue
+            start, end = self.offsets[term], self.offsets[term + 1]
+            rows = self.postings[start:end]
+            tf = self.frequencies[start:end]
+            # Rows are unique within a term's postings, so the fancy-indexed add is safe
+            scores[rows] += self.idf[term] * tf * (self.k1 + 1) / (tf + self.norms[rows])
+        return scores
+
+    def top_k(self, queries: Sequence[str], k: int = 4) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Row positions and scores of up to k chunks matching each query, best first"""
+        results = []
+        for query in queries:
+            scores = self.scores(query)
+            matching = np.flatnonzero(scores)
+            if len(matching) > k:
+                matching = matching[np.argpartition(-scores[matching], k - 1)[:k]]
+            order = np.argsort(-scores[matching], kind="stable")
+            results.append((matching[order], scores[matching[order]]))
+        return results
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Merge ranked lists of row positions; a row scores the sum of 1 / (k + rank) over the lists it appears in"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,22 @@
+from functools import lru_cache
+from typing import Callable
+
+import tiktoken
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model: str = "gpt-4o") -> Callable[[str], int]:
+    """Token counter for the model's tiktoken encoding.
+
+    Falls back to an estimate of four characters per token when the encoding
+    cannot be loaded, e.g. offline before tiktoken has cached its BPE files.
+    """
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Could not load tiktoken encoding for {model}, estimating tokens instead: {type(e).__name__}")
+        return lambda text: (len(text) + 3) // 4
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
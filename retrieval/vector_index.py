@@ -0,0 +1,103 @@
+import json
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .context_builder import chunk_id
+
+DEFAULT_INDEX_DIR = os.path.join(".cache", "indexes")
+
+
+def site_index_path(url: str, model: str, root: str = DEFAULT_INDEX_DIR) -> str:
+    """Where a site's index is saved; vectors of different embedding models are kept apart"""
+    model = re.sub(r"[^\w.-]+", "_", model)
+    return os.path.join(root, f"{urlparse(url).netloc.lower()}-{model}")
+
+
+class VectorIndex:
+    """Exact cosine-similarity index over a contiguous float32 matrix of normalized embeddings"""
+
+    def __init__(self, dim: int = 0):
+        self.matrix = np.empty((0, dim), dtype=np.float32)
+        self.docs: List[Document] = []
+        self._buffer: Optional[np.ndarray] = None  # matrix is a view of its first rows
+        self._rows: Optional[Dict[str, int]] = None  # chunk id -> row, built on the first lookup
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, docs: Sequence[Document], embeddings: Sequence[Sequence[float]]) -> None:
+        if not docs:
+            return
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        n, needed = len(self.docs), len(self.docs) + len(vectors)
+        if self._buffer is None or needed > len(self._buffer) or self._buffer.shape[1] != vectors.shape[1]:
+            # Grow geometrically so adding many small batches stays linear overall
+            self._buffer = np.empty((max(needed, 2 * n), vectors.shape[1]), dtype=np.float32)
+            if n:
+                self._buffer[:n] = self.matrix
+        self._buffer[n:needed] = vectors
+        self.matrix = self._buffer[:needed]
+        self.docs.extend(docs)
+        self._rows = None
+
+    def lookup(self, docs: Sequence[Document]) -> List[Optional[int]]:
+        """Row holding each chunk, matched by chunk id, or None for chunks not in the index"""
+        if self._rows is None:
+            self._rows = {chunk_id(doc): i for i, doc in enumerate(self.docs)}
+        return [self._rows.get(chunk_id(doc)) for doc in docs]
+
+    def search(self, query: Sequence[float], k: int = 4) -> List[Tuple[Document, float]]:
+        return self.search_batch([query], k)[0]
+
+    def top_k(self, queries: Sequence[Sequence[float]], k: int = 4) -> Tuple[np.ndarray, np.ndarray]:
+        """Row positions and scores of the k best chunks for each query, best first"""
+        q = self._normalize(np.asarray(queries, dtype=np.float32))
+        if len(self.docs) == 0:
+            return np.empty((len(q), 0), dtype=np.int64), np.empty((len(q), 0), dtype=np.float32)
+        scores = q @ self.matrix.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def search_batch(self, queries: Sequence[Sequence[float]], k: int = 4) -> List[List[Tuple[Document, float]]]:
+        top, top_scores = self.top_k(queries, k)
+        return [
+            [(self.docs[i], float(score)) for i, score in zip(row, row_scores)]
+            for row, row_scores in zip(top, top_scores)
+        ]
+
+    def save(self, path: str) -> None:
+        """Write the matrix to <path>.npy and the documents to <path>.json"""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so an index still memory-mapping the old file keeps reading it intact
+        with open(f"{path}.npy.tmp", "wb") as f:
+            np.save(f, self.matrix)
+        with open(f"{path}.json.tmp", "w", encoding="utf-8") as f:
+            json.dump([{"page_content": d.page_content, "metadata": d.metadata} for d in self.docs], f)
+        os.replace(f"{path}.npy.tmp", f"{path}.npy")
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> Optional["VectorIndex"]:
+        """Reopen an index written by save, memory-mapping the matrix instead of reading it"""
+        if not (os.path.exists(f"{path}.npy") and os.path.exists(f"{path}.json")):
+            return None
+        index = cls()
+        index.matrix = np.load(f"{path}.npy", mmap_mode="r" if mmap else None)
+        with open(f"{path}.json", encoding="utf-8") as f:
+            index.docs = [Document(**d) for d in json.load(f)]
+        return index
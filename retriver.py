@@ -1,26 +1,151 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from crawler import CrawlerConfig, PageStore, site_store_path
+from langchain_core.embeddings import Embeddings
+from instrumentation import stage
+from rate_limits import embedding_model
+from retrieval import (CachedEmbeddings, ContextBuilder, ContextChunk, EmbeddingCache, IngestConfig,
+                       IngestPipeline, KeywordIndex, VectorIndex, reciprocal_rank_fusion, site_index_path)
 
-from crawler import fetch_urls
-from langchain_openai import OpenAIEmbeddings
-from crawler import fetch_urls
-from langchain_core.vectorstores import InMemoryVectorStore
-from helper import load_urls
+MODES = ("hybrid", "vector", "keyword")
 
 class Retriver:
-    def __init__(self, url):
-        self.urls = fetch_urls(url)
-        self.docs = load_urls(self.urls)
-        self.vectorstore = InMemoryVectorStore.from_documents(
-            documents=self.docs, embedding=OpenAIEmbeddings()
-        )
-        self.retriver = self.vectorstore.as_retriever()
+    """Retrieves chunks of a crawled site by embeddings, BM25 keywords, or both fused by reciprocal rank.
+
+    The keyword-only mode never calls the embedding API, neither to build the index nor to query it.
+    """
+
+    def __init__(self, url, k: int = 4, incremental: bool = False,
+                 embeddings: Optional[Embeddings] = None, context_builder: Optional[ContextBuilder] = None,
+                 crawler_config: Optional[CrawlerConfig] = None, ingest_config: Optional[IngestConfig] = None,
+                 mode: str = "hybrid", build: bool = True):
+        if mode not in MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {', '.join(MODES)}")
+        self.url = url
+        self.k = k
+        self.mode = mode
+        self.crawler_config = crawler_config
+        self.ingest_config = ingest_config
+        self.store = PageStore(site_store_path(url) if incremental else None)
+        if mode == "keyword":
+            self.embeddings = None
+        else:
+            self.embeddings = embeddings or CachedEmbeddings(embedding_model(), EmbeddingCache())
+        self.index = VectorIndex()
+        # Incremental audits save the vector index and reuse its vectors next time
+        self.index_path = (site_index_path(url, getattr(self.embeddings, "model", type(self.embeddings).__name__))
+                           if incremental and self.embeddings is not None else None)
+        self.keywords = KeywordIndex()
+        self.context_builder = context_builder or ContextBuilder()
+        self.urls = []
+        self.docs = []
+        if build:
+            asyncio.run(self.abuild())
+
+    @classmethod
+    async def acreate(cls, url, **kwargs) -> "Retriver":
+        """Build a Retriver from inside a running event loop"""
+        retriver = cls(url, build=False, **kwargs)
+        await retriver.abuild()
+        return retriver
+
+    async def abuild(self, crawl_slots: Optional[asyncio.Semaphore] = None,
+                     embedding_slots: Optional[asyncio.Semaphore] = None):
+        """Crawl, chunk and embed the site as one pipeline, so the index is ready soon after the crawl ends.
+
+        The slots, when given, are shared with other sites being built at the same time.
+        """
+        previous = VectorIndex.load(self.index_path) if self.index_path else None
+        pipeline = IngestPipeline(self.store, self.embeddings, self.index, self.ingest_config, self.crawler_config,
+                                  keywords=self.keywords, crawl_slots=crawl_slots, embedding_slots=embedding_slots,
+                                  previous=previous)
+        self.urls, self.docs = await pipeline.run(self.url)
+        if self.index_path:
+            rows = previous.lookup(self.index.docs) if previous is not None else [None]
+            if None not in rows and len(set(rows)) == len(previous) == len(self.index):
+                # No chunk changed: serve the memory-mapped file, with keyword rows in its order
+                self.index = previous
+                self.docs = list(previous.docs)
+                self.keywords = KeywordIndex()
+                self.keywords.add(self.docs)
+                print(f"Reloaded the vector index of {len(previous)} unchanged chunks")
+            elif len(self.index):
+                self.index.save(self.index_path)
+            elif previous is not None:
+                # Likely a failed crawl (site down); keep the saved index for the next audit
+                print(f"No chunks indexed for {self.url}, keeping the saved index of {len(previous)} chunks")
+        self._print_cache_stats()
+
+    async def aindex(self):
+        """Embed chunks assigned to `docs` directly and add them to the vector and keyword indexes"""
+        with stage("embed"):
+            if self.embeddings is not None:
+                vectors = await self.embeddings.aembed_documents([doc.page_content for doc in self.docs])
+                self.index.add(self.docs, vectors)
+            self.keywords.add(self.docs)
+        self._print_cache_stats()
+
+    def _print_cache_stats(self):
+        if isinstance(self.embeddings, CachedEmbeddings):
+            print(f"Embedding cache: {self.embeddings.cache.hits} hits, {self.embeddings.cache.misses} misses")
+
+    def _embed_queries(self, questions):
+        return None if self.embeddings is None else self.embeddings.embed_documents(list(questions))
+
+    async def _aembed_queries(self, questions):
+        return None if self.embeddings is None else await self.embeddings.aembed_documents(list(questions))
+
+    def _scored_rankings(self, questions, query_vectors, n) -> List[Tuple[List[int], List[float]]]:
+        """Best n row positions and their scores for each question: cosine, BM25, or fused reciprocal rank"""
+        keyword = None if self.mode == "vector" else [
+            (rows.tolist(), scores.tolist()) for rows, scores in self.keywords.top_k(questions, n)]
+        if self.mode == "keyword":
+            return keyword
+        top, top_scores = self.index.top_k(query_vectors, n)
+        vector = list(zip(top.tolist(), top_scores.tolist()))
+        if self.mode == "vector":
+            return vector
+        fused = [reciprocal_rank_fusion([v, kw])[:n] for (v, _), (kw, _) in zip(vector, keyword)]
+        return [([row for row, _ in ranking], [score for _, score in ranking]) for ranking in fused]
+
+    def _rankings(self, questions, query_vectors, n) -> List[List[int]]:
+        """Best n row positions for each question, from the vector index, the keyword index, or both fused"""
+        return [rows for rows, _ in self._scored_rankings(questions, query_vectors, n)]
 
     def get_relevant_documents(self, question):
-        docs = self.retriver.invoke(question)
-        return self.format_docs(docs)
+        rows = self._rankings([question], self._embed_queries([question]), self.k)[0]
+        return self.format_docs([self.keywords.docs[i] for i in rows])
 
-    def format_docs(self, docs):
-        return "\n\n".join(doc.page_content for doc in docs)
+    async def aget_relevant_documents(self, question):
+        rows = self._rankings([question], await self._aembed_queries([question]), self.k)[0]
+        return self.format_docs([self.keywords.docs[i] for i in rows])
+
+    def get_context(self, questions) -> List[Tuple[str, str]]:
+        """Deduplicated, MMR-ordered context for several questions that fits the context builder's token budget,
+        as (chunk id, text) pairs; the id stays the same however much of the chunk's overlap was stripped"""
+        if not questions:
+            return []
+        return self.context_builder.pack(self._context_candidates(questions, self._embed_queries(questions)))
 
+    async def aget_context(self, questions) -> List[Tuple[str, str]]:
+        """Async counterpart of get_context"""
+        if not questions:
+            return []
+        return self.context_builder.pack(self._context_candidates(questions, await self._aembed_queries(questions)))
 
-    
+    def _context_candidates(self, questions, query_vectors) -> List[ContextChunk]:
+        best: Dict[int, float] = {}
+        for rows, scores in self._scored_rankings(questions, query_vectors, self.k * 2):
+            if self.mode != "vector" and scores:
+                # BM25 and fused scores are scaled by each question's best match, so questions weigh alike
+                scores = (np.asarray(scores) / max(scores)).tolist()
+            for i, score in zip(rows, scores):
+                best[i] = max(best.get(i, score), score)
+        if query_vectors is None:
+            return [ContextChunk(doc=self.keywords.docs[i], score=score, vector=None) for i, score in best.items()]
+        return [ContextChunk(doc=self.index.docs[i], score=score, vector=np.asarray(self.index.matrix[i]))
+                for i, score in best.items()]
 
+    def format_docs(self, docs):
+        return "\n\n".join(doc.page_content for doc in docs)